@@ -15,13 +15,25 @@
 # LIBRARY:  https://docs.python.org/3/library/logging.html
 # HOWTO:    https://docs.python.org/3/howto/logging.html
 # ===========================================================
+import hashlib
 import logging
+import math
+import os
 
 # ===========================================================
 # random is a module we will use to generate a random number
 # ===========================================================
 import random
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date  # https://docs.python.org/3/library/datetime.html
+from operator import add
+
+# NumPy is optional; calc_winners() falls back to array('b') without it
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ======================================================================
 # create "globals"
@@ -31,9 +43,18 @@ today = "".join(str(date.today()).split("-"))
 
 # ======================================================================
 # choices can be updated later to include additional options
+#   - any odd number of moves works, see Rules below (e.g. add "spock"
+#     and "lizard" for RPSLS)
 # ======================================================================
 choices = {1: "rock", 2: "paper", 3: "scissors"}
 
+# ======================================================================
+# outcome codes returned by Rules.outcome() and calc_winners(),
+# indexes into OUTCOMES
+# ======================================================================
+TIE, USER_WINS, COMP_WINS = 0, 1, 2
+OUTCOMES = ("N/A - tie", "You win!", "Computer Wins!")
+
 # =============================================================================
 # This section will set up logging. More information on logging found here:
 #   www.blog.pythonlibrary.org/2012/08/02/python-101-an-intro-to-logging
@@ -68,6 +89,148 @@ logging.getLogger(__name__).addHandler(console)
 logger = logging.getLogger(__name__)
 
 
+# ======================================================================
+# create a class to hold the rules of the game - which move beats which
+# ======================================================================
+class Rules(object):
+    """
+    The rules of an N-move RPS game, precomputed into an outcome table so
+    that settling a game is one table lookup however many moves there are.
+
+    Moves are numbered 1-N in the order of names. Without beats, N must be
+    odd and the classic cycle is extended with modular arithmetic: comp
+    beats user when (comp - user) % N is odd, so every move beats exactly
+    half of the others. With names ("rock", "paper", "scissors", "spock",
+    "lizard") that is RPSLS.
+
+    beats is an explicit dominance graph instead - a mapping of each move
+    name to the names it beats - and has to settle every pair one way.
+
+    """
+
+    def __init__(self, names, beats=None):
+        """
+        This is the constructor function - builds the outcome table.
+
+        """
+
+        logger.debug("Creating new Rules class object...")
+        self.names = tuple(names)
+        count = len(self.names)
+        if len(set(self.names)) != count:
+            raise ValueError("Move names must be unique")
+        if beats is None and (count < 3 or count % 2 == 0):
+            raise ValueError("Need an odd number of moves, at least 3")
+
+        # flat (N + 1) x (N + 1) table, indexed table[user * stride + comp]
+        # row/column 0 stay -1 so move numbers index it directly
+        self.stride = count + 1
+        self.table = array("b", [-1]) * (self.stride * self.stride)
+        if beats is None:
+            self._cycle()
+        else:
+            self._graph(beats)
+        logger.debug("Completed creation of %d-move Rules object...", count)
+
+    def _cycle(self):
+        """
+        This function fills the table from the modular arithmetic rule.
+
+        """
+
+        count = len(self.names)
+        for user in range(1, count + 1):
+            for comp in range(1, count + 1):
+                if user == comp:
+                    code = TIE
+                elif (comp - user) % count % 2:
+                    code = COMP_WINS
+                else:
+                    code = USER_WINS
+                self.table[user * self.stride + comp] = code
+
+    def _graph(self, beats):
+        """
+        This function fills the table from an explicit dominance graph.
+
+        """
+
+        numbers = {name: num for num, name in enumerate(self.names, 1)}
+        for num in numbers.values():
+            self.table[num * self.stride + num] = TIE
+        for winner, losers in beats.items():
+            for loser in losers:
+                if winner not in numbers or loser not in numbers:
+                    raise ValueError(
+                        "Unknown move in {} beats {}".format(winner, loser)
+                    )
+                win, lose = numbers[winner], numbers[loser]
+                if self.table[win * self.stride + lose] != -1:
+                    msg = "{} vs {} is settled twice".format(winner, loser)
+                    raise ValueError(msg)
+                self.table[win * self.stride + lose] = USER_WINS
+                self.table[lose * self.stride + win] = COMP_WINS
+        for user in numbers:
+            for comp in numbers:
+                if self.outcome(numbers[user], numbers[comp]) < 0:
+                    raise ValueError("No rule for {} vs {}".format(user, comp))
+
+    def __len__(self):
+        """
+        Returns the number of moves.
+
+        """
+
+        return len(self.names)
+
+    def __contains__(self, move):
+        """
+        Returns True if move is a valid move number (1-N).
+
+        """
+
+        return isinstance(move, int) and 0 < move < self.stride
+
+    @property
+    def choices(self):
+        """
+        This function returns the moves as a dictionary like choices.
+
+        """
+
+        return dict(enumerate(self.names, 1))
+
+    @property
+    def menu(self):
+        """
+        This function returns the moves for an input prompt:
+        "1 - rock, 2 - paper, 3 - scissors"
+
+        """
+
+        moves = enumerate(self.names, 1)
+        return ", ".join("{} - {}".format(num, name) for num, name in moves)
+
+    def outcome(self, user: int, comp: int):
+        """
+        Returns the outcome code (TIE, USER_WINS or COMP_WINS) of one game.
+
+        Raises ValueError for a move number outside 1-N.
+
+        """
+
+        if user not in self or comp not in self:
+            msg = "Please provide a number 1-{}".format(len(self.names))
+            raise ValueError(msg)
+        return self.table[user * self.stride + comp]
+
+
+# ======================================================================
+# the rules used by default everywhere below
+# ======================================================================
+rules = Rules(choices.values())
+
+
 # ======================================================================
 # create a class to be used for a user (or computer) making a "choice"
 # Inspired by:  https://stackoverflow.com/a/3694822
@@ -81,15 +244,19 @@ class Choice(object):
 
     """
 
-    def __init__(self, start=0):
+    def __init__(self, start=0, rule_set=None):
         """
         This is the constructor function - also known
         as what happens when this class is created.
 
+        rule_set is the Rules object choices are checked against; the
+        module rules when not given.
+
         """
 
         logger.debug("Creating new Choice class object...")
         self._choice = start  # could set to None, but we expect this to be INT
+        self.rules = rule_set if rule_set is not None else rules
         logger.debug("Completed creation of new Choice class object...")
 
     @property
@@ -115,9 +282,10 @@ class Choice(object):
             logger.warning("Integer not provided")
             return TypeError("Integer not provided")
 
-        if data not in choices.keys():
+        if data not in self.rules:
             logger.warning("Integer not provided from required input")
-            raise ValueError("Please provide a number 1-3")
+            msg = "Please provide a number 1-{}".format(len(self.rules))
+            raise ValueError(msg)
 
         logger.debug("Setting Choice class attribute for choice...")
         self._choice = data
@@ -131,13 +299,13 @@ class Choice(object):
         """
 
         logger.debug("Requesting input...")
-        choice_str = "1 - rock, 2 - paper, 3 - scissors"
+        choice_str = self.rules.menu
         test_bool = True
         while test_bool:
             in_put = input(
                 "Please provide your choice ({}):  ".format(choice_str)
             )  # noqa: E501
-            if in_put.isdigit() and int(in_put) in choices.keys():
+            if in_put.isdigit() and int(in_put) in self.rules:
                 test_bool = False
         logger.debug(
             "Correct input received. Returning response:  {}".format(in_put)
@@ -166,12 +334,109 @@ def get_user_input():
     return user_obj.choice
 
 
-def get_comp_choice():
+# ======================================================================
+# computer moves are drawn in blocks and handed out one at a time
+# ======================================================================
+class MoveBuffer(object):
+    """
+    A refillable source of uniformly random moves 1-moves.
+
+    Each refill draws block random bytes with one getrandbits() call and
+    turns them into moves with bytes.translate(): byte values at or above
+    the largest multiple of moves below 256 are rejected (dropped) rather
+    than folded in with %, so every move stays exactly equally likely. A
+    move then costs one next() on the bytes iterator. 256 moves or more
+    leave no byte value free to mark a rejected one, so fall back to
+    rng.randrange() per move.
+
+    rng is anything with getrandbits()/randrange() - the random module
+    (the default) or a random.Random of its own. Moves already drawn do
+    not change when rng is reseeded - call reset() after seeding to get
+    a repeatable sequence.
+
+    """
+
+    def __init__(self, moves, block=4096, rng=random):
+        self.moves = moves
+        self.block = block
+        self.rng = rng
+        if moves < 256:
+            limit = 256 - 256 % moves
+            table = [value % moves + 1 for value in range(limit)]
+            self._table = bytes(table + [0] * (256 - limit))
+        else:
+            self._table = None
+        self._next = iter(()).__next__
+
+    def _refill(self):
+        """
+        This function draws the next block of moves.
+
+        """
+
+        if self._table is None:
+            draw = self.rng.randrange
+            block = [draw(self.moves) + 1 for _ in range(self.block)]
+        else:
+            raw = self.rng.getrandbits(8 * self.block)
+            raw = raw.to_bytes(self.block, "little")
+            block = raw.translate(self._table).replace(b"\x00", b"")
+        logger.debug("Drew %d moves for the move buffer...", len(block))
+        self._next = iter(block).__next__
+
+    def reset(self):
+        """
+        This function drops the moves already drawn, e.g. after reseeding.
+
+        """
+
+        self._next = iter(()).__next__
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        """
+        Returns the next move, refilling the buffer when it runs out.
+
+        """
+
+        while True:
+            try:
+                return self._next()
+            except StopIteration:
+                # a small block can have every byte rejected
+                self._refill()
+
+
+_comp_moves = MoveBuffer(len(rules))
+
+
+def seed_comp_choice(seed=None):
+    """
+    This function seeds the random module and drops the computer moves
+    already drawn, so get_comp_choice() repeats after the same seed.
+    random.seed() alone would only apply from the next block of moves.
+
+    """
+
+    random.seed(seed)
+    _comp_moves.reset()
+
+
+def get_comp_choice(strategy=None):
     """
     This function randomly generates a number between 1 up to and including
     the max number of options. If base, it should be 3. If expanded, it
     will depend on the number of options and logic you have created.
 
+    strategy is an optional computer strategy object (see strategies); its
+    choose() picks the move instead. Tell it the user's move afterwards
+    with strategy.observe() so adaptive strategies can learn.
+
+    Moves are drawn ahead in blocks - use seed_comp_choice() rather than
+    random.seed() to make them repeatable.
+
     Returns the integer "chosen" by the computer/randomizer.
 
     """
@@ -183,16 +448,78 @@ def get_comp_choice():
     #   - why or why would this NOT be a good idea?
     # =====================================================================
 
-    logger.debug("Starting get_comp_choice()...")
-    random_int = random.randint(1, len(choices.keys()))  # nosec
-    logger.debug(
-        "Ending get_comp_choice() & returning:  {}".format(random_int)
-    )  # noqa: E501
-    # pass
+    if strategy is not None:
+        return strategy.choose()
+
+    # moves come pre-drawn from a MoveBuffer, which logs once per block
+    # rather than twice per move
+    random_int = next(_comp_moves)
 
     return random_int
 
 
+def calc_winners(user_moves, comp_moves, rule_set=None):
+    """
+    Settles a whole batch of games in one pass - the batch version of
+    calc_winner() for bot evaluation runs.
+
+    user_moves and comp_moves are equal length sequences of move numbers:
+    NumPy arrays, array('b') or any other iterable of ints. rule_set is the
+    Rules object to settle them by; the module rules when not given.
+
+    Returns the outcome code of every game (TIE, USER_WINS or COMP_WINS;
+    OUTCOMES[code] is the text calc_winner() would report). With NumPy this
+    is a single fancy-indexing lookup into the payoff matrix and the result
+    is an int8 ndarray, otherwise an array('b') built by mapping the same
+    table over both sequences.
+
+    Raises ValueError for mismatched lengths or moves not in the rules.
+
+    """
+
+    logger.debug("Starting calc_winners()...")
+    rule_set = rule_set if rule_set is not None else rules
+    table, stride = rule_set.table, rule_set.stride
+    bad_move = "Please provide a number 1-{}".format(len(rule_set))
+    if np is not None:
+        # integer arrays of any width index the table as they are - only
+        # lists, floats etc. get converted (one copy to intp)
+        user_moves, comp_moves = (
+            moves if moves.dtype.kind in "iu" else moves.astype(np.intp)
+            for moves in map(np.asarray, (user_moves, comp_moves))
+        )
+        if user_moves.shape != comp_moves.shape:
+            raise ValueError("user_moves and comp_moves differ in length")
+        if user_moves.size and (
+            min(user_moves.min(), comp_moves.min()) < 0
+            or max(user_moves.max(), comp_moves.max()) >= stride
+        ):
+            raise ValueError(bad_move)
+        payoff = np.frombuffer(table, dtype=np.int8)
+        outcomes = payoff.reshape(stride, stride)[user_moves, comp_moves]
+        if outcomes.size and outcomes.min() < 0:
+            raise ValueError(bad_move)
+    else:
+        if not isinstance(user_moves, array):
+            user_moves = array("l", user_moves)
+        if not isinstance(comp_moves, array):
+            comp_moves = array("l", comp_moves)
+        if len(user_moves) != len(comp_moves):
+            raise ValueError("user_moves and comp_moves differ in length")
+        if user_moves and (
+            min(min(user_moves), min(comp_moves)) < 0
+            or max(max(user_moves), max(comp_moves)) >= stride
+        ):
+            raise ValueError(bad_move)
+        cells = map(add, map(stride.__mul__, user_moves), comp_moves)
+        outcomes = array("b", map(table.__getitem__, cells))
+        if outcomes and min(outcomes) < 0:
+            raise ValueError(bad_move)
+    logger.debug("Ending calc_winners() with %d games...", len(outcomes))
+
+    return outcomes
+
+
 def calc_winner(user: int, comp: int):
     """
     This function takes 2 integer inputs user and comp. Utilizing the logic
@@ -226,16 +553,7 @@ def calc_winner(user: int, comp: int):
         """
 
         logger.debug("Ending calc_winner()...")
-        if user == comp:
-            return "N/A - tie"
-        elif (
-            (user == 1 and comp == 2)
-            or (user == 2 and comp == 3)
-            or (user == 3 and comp == 1)
-        ):
-            return "Computer Wins!"
-        else:
-            return "You win!"
+        return OUTCOMES[rules.outcome(user, comp)]
 
     logger.debug("Starting calc_winner()...")
     dict2rtn = dict()
@@ -248,6 +566,286 @@ def calc_winner(user: int, comp: int):
     return dict2rtn
 
 
+# ======================================================================
+# computer strategies - anything with choose() and observe() works with
+# simulate() below. rule_set is the Rules object, rng a random.Random.
+# ======================================================================
+class RandomStrategy(object):
+    """
+    Plays every move with equal probability - what get_comp_choice() does.
+
+    """
+
+    def __init__(self, rule_set, rng):
+        self.moves = MoveBuffer(len(rule_set), rng=rng)
+
+    def choose(self):
+        """
+        Returns the next move.
+
+        """
+
+        return next(self.moves)
+
+    def observe(self, move):
+        """
+        Takes the opponent's last move. Random play ignores it.
+
+        """
+
+
+class FixedStrategy(object):
+    """
+    Always plays the same move (rock unless told otherwise). Use
+    functools.partial(FixedStrategy, move=2) to pick another one.
+
+    """
+
+    def __init__(self, rule_set, rng, move=1):
+        if move not in rule_set:
+            msg = "Please provide a number 1-{}".format(len(rule_set))
+            raise ValueError(msg)
+        self.move = move
+
+    def choose(self):
+        """
+        Returns the next move.
+
+        """
+
+        return self.move
+
+    def observe(self, move):
+        """
+        Takes the opponent's last move. Fixed play ignores it.
+
+        """
+
+
+class MarkovStrategy(object):
+    """
+    Predicts the opponent's next move from their last order moves and
+    plays the move that beats it - an order-k Markov model of the player.
+
+    The last order moves are kept as one base-N number (the context), so
+    moving it on is a multiply, add and modulo. counts holds N counters
+    per context in one fixed array('H') of N ** (order + 1) entries, and
+    best the most likely next move per context, kept up to date as counts
+    change. observe() and choose() are therefore O(1) whatever the history
+    length, and memory is fixed up front (54 bytes of counts for RPS with
+    order 2). When a counter reaches the cap its context's counters are
+    halved, which bounds them and lets the model follow a player who
+    changes habits.
+
+    Until a context has been seen - or when the predicted move cannot be
+    beaten under the rules (possible with an explicit beats graph) -
+    moves come from a MoveBuffer on rng.
+
+    """
+
+    cap = 0xFFFF
+
+    def __init__(self, rule_set, rng, order=2):
+        self.moves = len(rule_set)
+        self.order = order
+        self.contexts = self.moves**order
+        self.counts = array("H", [0]) * (self.contexts * self.moves)
+        self.best = array("H", [0]) * self.contexts
+        self.context = 0
+        self.seen = 0
+        self.fallback = MoveBuffer(self.moves, rng=rng)
+
+        # counters[move] is a move that beats move, as the computer (0
+        # for "no prediction" and for a move nothing beats)
+        table, stride = rule_set.table, rule_set.stride
+        self.counters = [0] + [
+            next(
+                (
+                    comp
+                    for comp in range(1, self.moves + 1)
+                    if table[move * stride + comp] == COMP_WINS
+                ),
+                0,
+            )
+            for move in range(1, self.moves + 1)
+        ]
+
+    def choose(self):
+        """
+        Returns the next move.
+
+        """
+
+        if self.seen < self.order:
+            return next(self.fallback)
+        counter = self.counters[self.best[self.context]]
+        if not counter:
+            return next(self.fallback)
+        return counter
+
+    def observe(self, move):
+        """
+        Takes the opponent's last move and updates the model.
+
+        """
+
+        if self.seen < self.order:
+            self.seen += 1
+        else:
+            row = self.context * self.moves
+            slot = row + move - 1
+            count = self.counts[slot] + 1
+            if count > self.cap:
+                for cell in range(row, row + self.moves):
+                    self.counts[cell] >>= 1
+                count = self.counts[slot] + 1
+            self.counts[slot] = count
+            best = self.best[self.context]
+            if not best or count > self.counts[row + best - 1]:
+                self.best[self.context] = move
+        self.context = (self.context * self.moves + move - 1) % self.contexts
+
+
+# ======================================================================
+# computer strategies by name, e.g. strategies["markov"](rules, rng)
+# ======================================================================
+strategies = {
+    "random": RandomStrategy,
+    "fixed": FixedStrategy,
+    "markov": MarkovStrategy,
+}
+
+
+def _spawn_seeds(seed, count):
+    """
+    Derives count independent 256-bit seeds from seed, in the spirit of
+    NumPy's SeedSequence.spawn(): child i is a hash of (seed, i), so the
+    streams do not overlap and the same seed always spawns the same ones.
+
+    """
+
+    return [
+        int.from_bytes(
+            hashlib.blake2b(
+                "{}/{}".format(seed, child).encode(), digest_size=32
+            ).digest(),
+            "big",
+        )
+        for child in range(count)
+    ]
+
+
+def _play_games(strategy_a, strategy_b, games, seed, rule_set):
+    """
+    Plays games games of strategy_a (as the user) against strategy_b (as
+    the computer), each with its own random.Random spawned from seed.
+
+    Returns the counts indexed by outcome code: [ties, a wins, b wins].
+
+    """
+
+    seed_a, seed_b = _spawn_seeds(seed, 2)
+    player_a = strategy_a(rule_set, random.Random(seed_a))  # nosec
+    player_b = strategy_b(rule_set, random.Random(seed_b))  # nosec
+    table, stride = rule_set.table, rule_set.stride
+    counts = [0, 0, 0]
+    for _ in range(games):
+        move_a = player_a.choose()
+        move_b = player_b.choose()
+        counts[table[move_a * stride + move_b]] += 1
+        player_a.observe(move_b)
+        player_b.observe(move_a)
+    return counts
+
+
+def _interval(hits, games, z=1.96):
+    """
+    Returns the Wilson score interval (low, high) for hits out of games,
+    95% confidence by default. Unlike the normal approximation it stays
+    inside 0-1 even for rates at 0 or 1.
+
+    """
+
+    if not games:
+        return (0.0, 1.0)
+    rate = hits / games
+    scale = 1 + z * z / games
+    centre = (rate + z * z / (2 * games)) / scale
+    variance = rate * (1 - rate) / games + z * z / (4 * games * games)
+    spread = z * math.sqrt(variance) / scale
+    return (max(0.0, centre - spread), min(1.0, centre + spread))
+
+
+def simulate(
+    strategy_a=RandomStrategy,
+    strategy_b=RandomStrategy,
+    games=100000,
+    workers=None,
+    seed=0,
+    rule_set=None,
+):
+    """
+    Monte Carlo evaluation of strategy_a (as the user) against strategy_b
+    (as the computer) over games games.
+
+    The games are split into one shard per worker and the shards played in
+    a process pool (in this process when workers is 1). Each shard gets its
+    own seed spawned from seed, and its own pair of strategy objects, so
+    the result depends only on seed and workers - never on scheduling -
+    and is identical from run to run. Strategies must be picklable (module
+    level classes or functools.partial of them).
+
+    Returns a dictionary like this, rates and 95% intervals from strategy_a's
+    side:
+
+        {
+            'games': 100000,
+            'wins': {some integer}, 'ties': ..., 'losses': ...,
+            'rates': {'wins': 0.33, 'ties': ..., 'losses': ...},
+            'intervals': {'wins': (low, high), 'ties': ..., 'losses': ...},
+        }
+
+    """
+
+    logger.debug("Starting simulate() with %d games...", games)
+    rule_set = rule_set if rule_set is not None else rules
+    workers = workers or os.cpu_count() or 1
+    share, extra = divmod(games, workers)
+    shards = [share + (num < extra) for num in range(workers)]
+    args = (
+        [strategy_a] * workers,
+        [strategy_b] * workers,
+        shards,
+        _spawn_seeds(seed, workers),
+        [rule_set] * workers,
+    )
+    if workers == 1:
+        results = map(_play_games, *args)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_play_games, *args))
+
+    totals = [0, 0, 0]
+    for counts in results:
+        for code, count in enumerate(counts):
+            totals[code] += count
+    dict2rtn = {
+        "games": games,
+        "wins": totals[USER_WINS],
+        "ties": totals[TIE],
+        "losses": totals[COMP_WINS],
+    }
+    keys = ("wins", "ties", "losses")
+    dict2rtn["rates"] = {}
+    dict2rtn["intervals"] = {}
+    for key in keys:
+        dict2rtn["rates"][key] = dict2rtn[key] / (games or 1)
+        dict2rtn["intervals"][key] = _interval(dict2rtn[key], games)
+    logger.debug("Ending simulate()...")
+
+    return dict2rtn
+
+
 def print_winner(data_dict: dict):
     """
     This function takes in a dictionary and prints to screen/CLI:
@@ -291,6 +889,9 @@ if __name__ == "__main__":
     # keep going until they want to stop
     stop_game = False
 
+    # the computer learns the player's habits as the session goes on
+    comp_player = strategies["markov"](rules, random.Random())
+
     print("Welcome to the latest RPS game!\n")
     while not stop_game:
         user = input(prnt_menu())
@@ -314,7 +915,8 @@ if __name__ == "__main__":
             # ==========================================================
             user = get_user_input()
             print("You have chosen:\t{}".format(user))
-            comp = get_comp_choice()
+            comp = get_comp_choice(comp_player)
+            comp_player.observe(user)
             print("Computer has chosen:\t{}".format(comp))
             data_dict = calc_winner(user, comp)
             print_winner(data_dict)
@@ -20,146 +20,3945 @@
 import logging
 
 # Additional required Libraries
+import asyncio  # https://docs.python.org/3/library/asyncio.html
+import bz2
+import codecs
+import csv
+import glob  # https://docs.python.org/3/library/glob.html
+import gzip
+import hashlib
+import json  # https://docs.python.org/3/library/json.html
+import lzma
+import mmap  # https://docs.python.org/3/library/mmap.html
+import os
+import queue
 import re  # https://docs.python.org/3/library/re.html
-from datetime import date  # https://docs.python.org/3/library/datetime.html
+import socket
+import sqlite3  # https://docs.python.org/3/library/sqlite3.html
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing, nullcontext
+
+# https://docs.python.org/3/library/datetime.html
+from datetime import date, datetime
+from functools import lru_cache, partial
+from itertools import islice
 from pathlib import Path
 
+# zstd is only in the standard library from Python 3.14 on
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
 # ======================================================================
 # create "globals"
 # ======================================================================
 # date.today() == "YYYY-MM-DD" ==> "YYYYMMDD"
 today = "".join(str(date.today()).split("-"))
 
-input_file = "../Files/Alice In Wonderland Text.txt"
+input_file = "../Files/Alice In Wonderland Text.txt"
+
+# =============================================================================
+# This section will set up logging. More information on logging found here:
+#   www.blog.pythonlibrary.org/2012/08/02/python-101-an-intro-to-logging
+#   www.digitalocean.com/community/tutorials/how-to-use-logging-in-python3
+#   www.loggly.com/ultimate-guide/python-logging-basics
+# =============================================================================
+#   NOTES:
+#       - some of the logging is not consistent throughout ... this is
+#           intentional so you can see other ways of leaving breadcrumbs
+#           for your future self
+#       - as mentioned before, there is no one right way to code, so several
+#           different styles have been shared here
+#       - logging levels:
+#           https://docs.python.org/3/library/logging.html#logging-levels
+# =============================================================================
+logging.basicConfig(
+    # consider using formatting instead
+    filename="PHPBBCW3-{}.log".format(
+        today
+    ),  # consider using formatting instead  # noqa: E501
+    filemode="a+",  # overwrites the file every time
+    level=logging.DEBUG,  # lowest logging level
+    format="%(asctime)s|%(levelname)s: %(name)s @ %(lineno)d|%(message)s",
+)
+
+# setup logging buffer for console
+console = logging.StreamHandler()
+# console.setLevel(logging.DEBUG)  # all DEBUG or higher will show on console
+console.setLevel(logging.WARNING)  # all DEBUG or higher will show on console
+
+# set format easy for console to use
+formatter = logging.Formatter("%(asctime)s : %(levelname)s : %(message)s")
+console.setFormatter(formatter)
+logging.getLogger(__name__).addHandler(console)
+logger = logging.getLogger(__name__)
+
+
+# ======================================================================
+# regex characters - a pattern without any of these (or a backslash) is
+# plain text and can be found with "in" / find() instead of re.search()
+# ======================================================================
+_REGEX_META = ".^$*+?{}[]|()"
+# how many characters follow the letter of the fixed length escapes, and
+# how re reads the digits of \0, octal and backreference escapes
+_ESCAPE_DIGITS = {"x": 2, "u": 4, "U": 8}
+_OCTAL_RE = re.compile(r"0[0-7]{0,2}|[0-7]{1,3}")
+_BACKREF_RE = re.compile(r"[0-9]{1,2}")
+_PATTERN_CACHE_SIZE = 256
+
+# ======================================================================
+# escapes & tokens where a bytes regex run over the whole file could miss
+# a line that the str regex run over a single (rstripped) line would find
+#   - anything looking at the end of the line ($, \Z, lookarounds)
+#   - anything that matches "one character" (., \w, [^...]) since a
+#     non-ASCII character is several bytes once encoded
+#   - escapes only str patterns have (\N{...}, \uXXXX, \UXXXXXXXX)
+# ======================================================================
+_BUFFER_UNSAFE_ESCAPES = "AZBwWsSdDNuU"
+_MMAP_ENCODING = "utf-8"
+_DECODE_ERRORS = "replace"  # bad bytes become U+FFFD instead of raising
+_COUNT_BLOCK = 1 << 24  # 16 MiB
+_MIN_CHUNK = 1 << 20  # never hand a worker less than 1 MiB
+_RANGES_PER_WORKER = 4  # smaller ranges - stopping early waits on less
+
+# trigram index - how many line numbers to look up at a time
+_SQL_BATCH = 500
+
+# digits kept free for the match count when streaming results to a file
+_COUNT_WIDTH = 20
+
+# follow mode - where each (file, pattern) remembers how far it got, and
+# how much of the end of a file to read at a time to find the last line
+_FOLLOW_STATE = "PHPBBCW3-follow.json"
+_TAIL_BLOCK = 1 << 16
+
+# result cache - where it lives and how big it may get (every search
+# option is in the key - mmap_mode, workers, index and bytes_mode decode
+# as UTF-8 whatever the locale, so need not agree with a plain search)
+_CACHE_PATH = "PHPBBCW3-cache.sqlite"
+_CACHE_MAX_BYTES = 64 << 20  # 64 MiB
+
+# print_to_file() - write buffer size, and the binary format's run header
+# (tag, pattern length, record count, has context) and line record
+# (line number, text length, is match)
+_WRITE_BUFFER = 1 << 20
+_BIN_RUN = struct.Struct("<4sIQ?")
+_BIN_TAG = b"W3HR"
+_BIN_LINE = struct.Struct("<QI?")
+
+# text output - what goes between runs, and the sidecar index of runs
+_RUN_DIVIDER = "\n{}\n\n".format("=" * 69)
+_RUN_HEADER = "The pattern you asked to search for is:\t"
+_RUN_COUNT_RE = re.compile(rb"The pattern was found in (\d+) lines\.")
+_RUNS_EXT = ".runs"
+
+# search service - how big a piece of a corpus one worker searches, and
+# the corpora each worker process has mapped
+_SERVER_CHUNK = 4 << 20  # 4 MiB
+_worker_maps = {}
+
+# notebook search - how to spot the top of the repo, where the course
+# notebooks live from there, which output types hold text, and parsed
+# cells by notebook
+_REPO_MARKERS = ("mkdocs.yml", "pyproject.toml")
+_NOTEBOOK_DIRS = ("docs/BC_Weeks", "docs/jupyterlite/files")
+_NOTEBOOK_TEXT = ("text/plain", "text/markdown")
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m")
+_notebook_cells = {}
+
+# line index sidecar - 8 byte tag, file size and mtime_ns, then offsets
+_LINEIDX_HEADER = struct.Struct("<8sQQ")
+_LINEIDX_TAG = b"LINEIDX1"
+
+# compressed input - magic numbers, and how much to decompress at a time
+# (the background thread stays at most _DECOMP_QUEUE blocks ahead)
+# bz2's "BZh" alone is too easy to hit in text, so its block size digit
+# and the first block's (or an empty stream's end) magic are checked too
+_MAGIC = (
+    (re.compile(rb"\x1f\x8b"), "gzip"),
+    (re.compile(rb"BZh[1-9](?:1AY&SY|\x17rE8P\x90)"), "bz2"),
+    (re.compile(rb"\xfd7zXZ\x00"), "xz"),
+    (re.compile(rb"\x28\xb5\x2f\xfd"), "zstd"),
+)
+_MAGIC_LEN = 10
+_OPENERS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open, "zstd": None}
+if zstd is not None:
+    _OPENERS["zstd"] = zstd.open
+_DECOMP_BLOCK = 1 << 20
+_DECOMP_QUEUE = 8
+
+
+def _is_literal(pttrn):
+    """
+    Checks if a pattern is just plain text (no regex characters at all).
+
+    Returns a boolean.
+
+    """
+
+    return not any(char in _REGEX_META or char == "\\" for char in pttrn)
+
+
+@lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def _compile(pttrn, flags=0):
+    """
+    Compiles a (str or bytes) pattern once. The least recently used
+    patterns are dropped once the cache is full.
+
+    Returns a compiled regex.
+
+    """
+
+    return re.compile(pttrn, flags)
+
+
+@lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def _matcher(pttrn):
+    """
+    Picks the quickest way to check a line for pttrn - a plain substring
+    check for plain text, the compiled regex for everything else.
+
+    Returns a function that takes a line and returns a boolean.
+
+    """
+
+    if _is_literal(pttrn):
+        return lambda line: pttrn in line
+
+    pttrn_re = _compile(pttrn)
+    return lambda line: pttrn_re.search(line) is not None
+
+
+# ======================================================================
+# linear time regex engine (Thompson NFA)
+#   re.search() backtracks, so a pattern like (a+)+$ can take forever on
+#   a long line. This engine keeps a set of NFA states per character and
+#   never backtracks: O(len(line) * len(pattern)) for any pattern, at
+#   the cost of only covering the "regular" part of re's syntax (no
+#   backreferences, lookarounds or inline flags).
+# ======================================================================
+_MAX_REPEAT = 1000  # biggest {m,n} the engine will unroll
+_MAX_STATES = 100000  # most NFA states, nested repeats multiply up
+_BOUNDS_RE = re.compile(r"\{(\d*)(,?)(\d*)\}")
+
+
+def _is_word(char):
+    """
+    Same idea of a "word" character as re's \\w for str patterns.
+
+    """
+
+    return char.isalnum() or char == "_"
+
+
+_CLASS_ESCAPES = {
+    "d": str.isdecimal,
+    "D": lambda char: not char.isdecimal(),
+    "w": _is_word,
+    "W": lambda char: not _is_word(char),
+    "s": str.isspace,
+    "S": lambda char: not char.isspace(),
+}
+_CHAR_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v"}
+_QUANTIFIERS = {"*": (0, None), "+": (1, None), "?": (0, 1)}
+
+
+class _LinearRegex(object):
+    """
+    Parses a pattern into an NFA and searches lines with it, one
+    character at a time, without ever backtracking.
+
+    """
+
+    # NFA state kinds
+    CHAR, SPLIT, ASSERT, MATCH = range(4)
+
+    def __init__(self, pttrn):
+        """
+        Parses pttrn and builds the NFA.
+
+        Raises ValueError if pttrn uses something this engine cannot do
+        in linear time (backreferences, lookarounds, flags ...) or would
+        need more than _MAX_STATES states - checked before building, so
+        (a{1000}){1000} fails at once instead of tying up the process.
+
+        """
+
+        self.pttrn = pttrn
+        self._pos = 0
+        self.kinds = []
+        self.data = []
+        self.outs = []
+        tree = self._parse_alt()
+        if self._pos < len(pttrn):
+            self._error("unbalanced parenthesis")
+        if self._size(tree) > _MAX_STATES:
+            self._error("more than {} NFA states".format(_MAX_STATES))
+        match = self._state(_LinearRegex.MATCH, None, [])
+        self.start = self._build(tree, match)
+
+    # ------------------------------------------------------------------
+    # parsing - pattern text to a small tree of tuples
+    # ------------------------------------------------------------------
+    def _error(self, msg):
+        raise ValueError(
+            "Linear engine:  {} at position {} of '{}'".format(
+                msg, self._pos, self.pttrn
+            )
+        )
+
+    def _peek(self):
+        return self.pttrn[self._pos] if self._pos < len(self.pttrn) else ""
+
+    def _next(self):
+        char = self._peek()
+        self._pos += 1
+        return char
+
+    def _parse_alt(self):
+        branches = [self._parse_concat()]
+        while self._peek() == "|":
+            self._next()
+            branches.append(self._parse_concat())
+        return ("alt", branches) if len(branches) > 1 else branches[0]
+
+    def _parse_concat(self):
+        items = []
+        while self._peek() not in ("", "|", ")"):
+            items.append(self._parse_repeat())
+        return ("cat", items)
+
+    def _parse_repeat(self):
+        atom = self._parse_atom()
+        while self._peek() in ("*", "+", "?", "{"):
+            if self._peek() == "{":
+                bounds = self._parse_bounds()
+                if bounds is None:
+                    break
+                low, high = bounds
+            else:
+                low, high = _QUANTIFIERS[self._next()]
+            # lazy (*?) finds the same lines, possessive (*+) does not
+            if self._peek() == "?":
+                self._next()
+            elif self._peek() == "+":
+                self._error("possessive quantifiers are not supported")
+            atom = ("repeat", atom, low, high)
+        return atom
+
+    def _parse_bounds(self):
+        found = _BOUNDS_RE.match(self.pttrn, self._pos)
+        # like re, a { that is not a valid repeat is just a character
+        if found is None or not (found.group(1) or found.group(3)):
+            return None
+        self._pos = found.end()
+        low = int(found.group(1) or 0)
+        if not found.group(2):
+            high = low
+        else:
+            high = int(found.group(3)) if found.group(3) else None
+        if max(low, high or 0) > _MAX_REPEAT:
+            self._error("repeat bigger than {}".format(_MAX_REPEAT))
+        if high is not None and high < low:
+            self._error("min repeat greater than max repeat")
+        return low, high
+
+    def _parse_atom(self):
+        char = self._next()
+        if char == "(":
+            if self._peek() == "?":
+                self._next()
+                if self._peek() == ":":
+                    self._next()
+                elif self.pttrn.startswith("P<", self._pos):
+                    self._pos = self.pttrn.index(">", self._pos) + 1
+                else:
+                    self._error("only (...), (?:...) and (?P<name>...)")
+            tree = self._parse_alt()
+            if self._next() != ")":
+                self._error("missing ), unterminated subpattern")
+            return tree
+        if char == "[":
+            return ("char", self._parse_class())
+        if char == ".":
+            return ("char", lambda other: other != "\n")
+        if char in ("^", "$"):
+            return ("assert", char)
+        if char in ("*", "+", "?"):
+            self._error("nothing to repeat")
+        if char == "\\":
+            return self._parse_escape()
+        return ("char", char)
+
+    def _parse_escape(self):
+        char = self._next()
+        if char in _CLASS_ESCAPES:
+            return ("char", _CLASS_ESCAPES[char])
+        if char in "bBAZ":
+            return ("assert", char)
+        if char in _CHAR_ESCAPES:
+            return ("char", _CHAR_ESCAPES[char])
+        if char == "" or char.isalnum():
+            self._error("escape \\{} is not supported".format(char))
+        return ("char", char)
+
+    def _parse_class(self):
+        negate = self._peek() == "^"
+        if negate:
+            self._next()
+        chars = set()
+        ranges = []
+        tests = []
+        first = True
+        while first or self._peek() != "]":
+            first = False
+            char = self._next()
+            if char == "":
+                self._error("unterminated character set")
+            if char == "\\":
+                char = self._next()
+                if char in _CLASS_ESCAPES:
+                    tests.append(_CLASS_ESCAPES[char])
+                    continue
+                if char.isalnum() and char not in _CHAR_ESCAPES:
+                    self._error("escape \\{} is not supported".format(char))
+                char = _CHAR_ESCAPES.get(char, char)
+            # a - right before the ] is just a -
+            is_range = self._peek() == "-" and not self.pttrn.startswith(
+                "]", self._pos + 1
+            )
+            if is_range and self._pos + 1 < len(self.pttrn):
+                self._next()
+                high = self._next()
+                if high == "\\":
+                    high = self._next()
+                    high = _CHAR_ESCAPES.get(high, high)
+                ranges.append((char, high))
+            else:
+                chars.add(char)
+        self._next()
+
+        def test(other):
+            found = (
+                other in chars
+                or any(low <= other <= high for low, high in ranges)
+                or any(check(other) for check in tests)
+            )
+            return found != negate
+
+        return test
+
+    # ------------------------------------------------------------------
+    # building - Thompson's construction, from the end of the pattern
+    # back to the start so every piece knows where it goes next
+    # ------------------------------------------------------------------
+    def _size(self, tree):
+        """
+        Counts the states _build() would make for tree, without making
+        them.
+
+        """
+
+        kind = tree[0]
+        if kind in ("char", "assert"):
+            return 1
+        if kind == "cat":
+            return sum(self._size(item) for item in tree[1])
+        if kind == "alt":
+            return sum(self._size(branch) for branch in tree[1]) + 1
+
+        _, item, low, high = tree
+        size = self._size(item)
+        if high is None:
+            return (low + 1) * size + 1
+        return (high - low) * (size + 1) + low * size
+
+    def _state(self, kind, data, outs):
+        self.kinds.append(kind)
+        self.data.append(data)
+        self.outs.append(outs)
+        return len(self.kinds) - 1
+
+    def _build(self, tree, nxt):
+        kind = tree[0]
+        if kind == "char":
+            return self._state(_LinearRegex.CHAR, tree[1], [nxt])
+        if kind == "assert":
+            return self._state(_LinearRegex.ASSERT, tree[1], [nxt])
+        if kind == "cat":
+            for item in reversed(tree[1]):
+                nxt = self._build(item, nxt)
+            return nxt
+        if kind == "alt":
+            starts = [self._build(branch, nxt) for branch in tree[1]]
+            return self._state(_LinearRegex.SPLIT, None, starts)
+
+        # repeat - the optional part first, then the copies that must be
+        _, item, low, high = tree
+        if high is None:
+            loop = self._state(_LinearRegex.SPLIT, None, [])
+            self.outs[loop].extend([self._build(item, loop), nxt])
+            nxt = loop
+        else:
+            for _ in range(high - low):
+                nxt = self._state(
+                    _LinearRegex.SPLIT, None, [self._build(item, nxt), nxt]
+                )
+        for _ in range(low):
+            nxt = self._build(item, nxt)
+        return nxt
+
+    # ------------------------------------------------------------------
+    # searching
+    # ------------------------------------------------------------------
+    def _assert(self, kind, line, pos):
+        if kind in ("^", "A"):
+            return pos == 0
+        if kind in ("$", "Z"):
+            return pos == len(line)
+        before = pos > 0 and _is_word(line[pos - 1])
+        after = pos < len(line) and _is_word(line[pos])
+        return (before != after) == (kind == "b")
+
+    def _add(self, states, state, line, pos):
+        """
+        Adds a state to the set, following every empty (SPLIT / ASSERT)
+        step from it. Returns True if the MATCH state was reached.
+
+        """
+
+        todo = [state]
+        while todo:
+            state = todo.pop()
+            if state in states:
+                continue
+            states.add(state)
+            kind = self.kinds[state]
+            if kind == _LinearRegex.MATCH:
+                return True
+            if kind == _LinearRegex.SPLIT:
+                todo.extend(reversed(self.outs[state]))
+            elif kind == _LinearRegex.ASSERT:
+                if self._assert(self.data[state], line, pos):
+                    todo.append(self.outs[state][0])
+        return False
+
+    def search(self, line, budget=None):
+        """
+        Checks if the pattern matches anywhere in line.
+
+        Optional inputs:
+        : budget - a _SearchBudget to charge the work to
+
+        Returns a boolean.
+
+        """
+
+        current = set()
+        if self._add(current, self.start, line, 0):
+            return True
+        for pos, char in enumerate(line, 1):
+            if budget is not None:
+                budget.spend(len(current))
+            following = set()
+            for state in current:
+                if self.kinds[state] != _LinearRegex.CHAR:
+                    continue
+                test = self.data[state]
+                hit = test == char if isinstance(test, str) else test(char)
+                nxt = self.outs[state][0]
+                if hit and self._add(following, nxt, line, pos):
+                    return True
+            # a new attempt starts at every position, like re.search()
+            if self._add(following, self.start, line, pos):
+                return True
+            current = following
+        return False
+
+
+class _SearchBudget(object):
+    """
+    Keeps track of how much work one search has done, and stops it with
+    a TimeoutError once it goes over its step count or time limit.
+
+    """
+
+    def __init__(self, max_steps=None, timeout=None):
+        self.steps = 0
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self._deadline = None
+        if timeout is not None:
+            self._deadline = time.monotonic() + timeout
+
+    def spend(self, steps):
+        self.steps += steps
+        if self.max_steps is not None and self.steps > self.max_steps:
+            msg = "Search went over {} steps.".format(self.max_steps)
+            raise TimeoutError(msg)
+        if self._deadline is not None and time.monotonic() > self._deadline:
+            msg = "Search went over {} seconds.".format(self.timeout)
+            raise TimeoutError(msg)
+
+
+@lru_cache(maxsize=_PATTERN_CACHE_SIZE)
+def _compile_linear(pttrn):
+    """
+    Builds the linear time NFA for pttrn once.
+
+    Returns a _LinearRegex.
+
+    """
+
+    return _LinearRegex(pttrn)
+
+
+def _linear_matcher(pttrn, max_steps=None, timeout=None):
+    """
+    Like _matcher(), but regexes run on the linear time engine and all
+    lines checked by the returned function share one budget.
+
+    Required inputs:
+    : pttrn - the pattern to look for
+
+    Optional inputs:
+    : max_steps - most NFA steps allowed for the whole search
+    : timeout - most seconds allowed for the whole search
+
+    Returns a function that takes a line and returns a boolean.
+
+    """
+
+    if _is_literal(pttrn):
+        return _matcher(pttrn)
+
+    regex = _compile_linear(pttrn)
+    budget = _SearchBudget(max_steps, timeout)
+    return lambda line: regex.search(line, budget)
+
+
+def _ascii_word_next_to(pttrn, idx):
+    """
+    Checks if the \\b escape ending at idx sits right next to a plain
+    ASCII letter or digit that must be there. Only then does a bytes \\b
+    find every boundary the str \\b would (for "é." the str regex sees a
+    boundary before the "." but the bytes regex does not).
+
+    Returns a boolean.
+
+    """
+
+    def plain(char):
+        return char.isascii() and char.isalnum()
+
+    nxt = idx + 1
+    after = pttrn[nxt:][:2]
+    if plain(after[:1]) and after[1:] not in ("?", "*", "{"):
+        return True
+
+    # the char before the backslash, unless it is itself escaped
+    if idx < 2 or not plain(pttrn[idx - 2]):
+        return False
+    return idx < 3 or pttrn[idx - 3] != "\\"
+
+
+def _buffer_safe(pttrn):
+    """
+    Checks if a pattern can be run as a bytes regex over a whole buffer
+    and still find every line the line-by-line search would find.
+
+    Required inputs:
+    : pttrn - the (str) pattern to check
+
+    Returns a boolean.
+
+    """
+
+    # plain text is found byte for byte, whatever the characters
+    if _is_literal(pttrn):
+        return True
+
+    if not pttrn.isascii():
+        return False
+
+    escaped = False
+    for idx, char in enumerate(pttrn):
+        if escaped:
+            escaped = False
+            if char in _BUFFER_UNSAFE_ESCAPES:
+                return False
+            if char == "b" and not _ascii_word_next_to(pttrn, idx):
+                return False
+        elif char == "\\":
+            escaped = True
+        elif char in ".$":
+            return False
+        elif char == "[" and pttrn.startswith("^", idx + 1):
+            return False
+        # (?: and (?P are fine - flags and lookarounds are not
+        elif char == "(" and pttrn.startswith("?", idx + 1):
+            if not pttrn.startswith(("?:", "?P"), idx + 1):
+                return False
+
+    return True
+
+
+def _count_newlines(buf, start, end):
+    """
+    Counts the newlines in buf[start:end], a block at a time so a huge
+    gap between two hits is never copied out of the map in one go.
+
+    Returns an integer.
+
+    """
+
+    count = 0
+    while start < end:
+        stop = min(start + _COUNT_BLOCK, end)
+        count += buf[start:stop].count(b"\n")
+        start = stop
+    return count
+
+
+def _iter_mmap(file_in, pttrn, start=0, end=None, spans=False, line_idx=None):
+    """
+    Maps the whole file into memory and runs a compiled bytes regex over
+    it once, instead of calling re.search() on every line.
+
+    Every hit is only a candidate: the line it landed in is decoded and
+    checked again with the str pattern, so results are the same as the
+    line-by-line search. Searching restarts at the next line after a hit.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+
+    Optional inputs:
+    : start / end - byte range to search (must start on a line)
+    : spans - yield (line number, start, end) ints - the line's byte range
+              without its newline - instead of the line itself
+    : line_idx - the file's LineIndex, to look line numbers up instead of
+                 counting the newlines between hits
+
+    Yields each match, with line numbers counted from the start of the
+    range. Returns (StopIteration.value) the number of lines in the range.
+
+    """
+
+    logger.debug("Starting _iter_mmap()...")
+    with open(file_in, "rb") as file_obj:
+        # mmap cannot map an empty file
+        if not file_obj.seek(0, 2):
+            return 0
+
+        with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            found = _scan_buffer(buf, pttrn, start, end, spans, line_idx)
+            line_cnt = yield from found
+
+    logger.debug("... Ending _iter_mmap()")
+    return line_cnt
+
+
+def _scan_buffer(buf, pttrn, start=0, end=None, spans=False, line_idx=None):
+    """
+    The search behind _iter_mmap(), over any buffer (mmap, bytes ...).
+    Lines end at \n only - a lone \r does not split a line the way text
+    mode's universal newlines do (see iter_matches()).
+
+    Yields and returns the same as _iter_mmap().
+
+    """
+
+    matches = _matcher(pttrn)
+    if _is_literal(pttrn):
+        literal = pttrn.encode(_MMAP_ENCODING)
+    else:
+        literal = None
+        bytes_re = _compile(pttrn.encode(_MMAP_ENCODING), re.MULTILINE)
+
+    if end is None:
+        end = len(buf)
+    pos = start
+    line_cnt = 0
+    counted_to = start
+    if line_idx is not None:
+        first_line = line_idx.newlines_before(start)
+    while pos < end:
+        if literal is not None:
+            hit = buf.find(literal, pos, end)
+        else:
+            match = bytes_re.search(buf, pos, end)
+            hit = -1 if match is None else match.start()
+        if hit == -1:
+            break
+
+        line_start = buf.rfind(b"\n", start, hit) + 1
+        line_start = max(line_start, start)
+        line_end = buf.find(b"\n", line_start, end)
+        if line_end == -1:
+            line_end = end
+
+        # newline-offset scan from the last line we counted to - or a
+        # lookup when there is a line index
+        if line_idx is not None:
+            line_cnt = line_idx.newlines_before(line_start) - first_line
+        else:
+            line_cnt += _count_newlines(buf, counted_to, line_start)
+        counted_to = line_start
+
+        raw = buf[line_start:line_end]
+        line = raw.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip()
+        if matches(line):
+            if spans:
+                yield line_cnt, line_start, line_end
+            else:
+                yield str(line_cnt), line
+
+        pos = line_end + 1
+
+    if line_idx is not None:
+        return line_idx.newlines_before(end) - first_line
+    line_cnt += _count_newlines(buf, counted_to, end)
+    return line_cnt
+
+
+def _iter_lines_range(file_in, pttrn, start, end):
+    """
+    Line by line search over a byte range of a file - used by workers
+    when the pattern is not safe to run over the raw bytes.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+    : start / end - byte range to search (must start on a line)
+
+    Yields each match. Returns the number of lines in the range.
+
+    """
+
+    line_cnt = 0
+    matches = _matcher(pttrn)
+
+    with open(file_in, "rb") as file_obj:
+        file_obj.seek(start)
+        pos = start
+        for raw in file_obj:
+            if pos >= end:
+                break
+            pos += len(raw)
+
+            line = raw.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip()
+            if matches(line):
+                yield str(line_cnt), line
+
+            line_cnt += 1
+
+    return line_cnt
+
+
+def _range_search(pttrn, line_idx=None):
+    """
+    Picks how to search a byte range of a file: the bytes regex over the
+    map when the pattern allows it (looking line numbers up in line_idx,
+    if given), line by line when it does not.
+
+    Returns a generator function.
+
+    """
+
+    if not _buffer_safe(pttrn):
+        return _iter_lines_range
+    if line_idx is not None:
+        return partial(_iter_mmap, line_idx=line_idx)
+    return _iter_mmap
+
+
+def _match_range(file_in, pttrn, start, end, index_path=None):
+    """
+    Worker for the chunked search - searches one byte range of a file
+    (looking line numbers up in the LineIndex at index_path, if given).
+
+    Returns a tuple of (list of matches, lines in the range).
+
+    """
+
+    matches = []
+    line_idx = None
+    if index_path is not None and _buffer_safe(pttrn):
+        line_idx = LineIndex(file_in, index_path)
+    found = _range_search(pttrn, line_idx)(file_in, pttrn, start, end)
+    try:
+        while True:
+            matches.append(next(found))
+    except StopIteration as stop:
+        return matches, stop.value
+    finally:
+        if line_idx is not None:
+            line_idx.close()
+
+
+def _line_ranges(file_in, parts, line_idx=None):
+    """
+    Splits a file into (up to) parts byte ranges of about the same size.
+    Every range starts at the beginning of a line.
+
+    Required inputs:
+    : file_in - file to split
+    : parts - how many ranges to aim for
+
+    Optional inputs:
+    : line_idx - the file's LineIndex, to look the line starts up instead
+                 of reading the file around each guess
+
+    Returns a list of (start, end) tuples.
+
+    """
+
+    size = os.path.getsize(file_in)
+    bounds = [0]
+    if line_idx is not None:
+        for num in range(1, parts):
+            bound = line_idx.next_line_start(size * num // parts)
+            if bounds[-1] < bound < size:
+                bounds.append(bound)
+        bounds.append(size)
+        return list(zip(bounds, bounds[1:]))
+
+    with open(file_in, "rb") as file_obj:
+        for num in range(1, parts):
+            guess = size * num // parts
+            if guess <= bounds[-1]:
+                continue
+            # step back one byte so a guess right on a line start stays put
+            file_obj.seek(guess - 1)
+            file_obj.readline()
+            if bounds[-1] < file_obj.tell() < size:
+                bounds.append(file_obj.tell())
+    bounds.append(size)
+
+    return list(zip(bounds, bounds[1:]))
+
+
+def _iter_chunked(file_in, pttrn, workers, line_idx=None):
+    """
+    Searches one big file with a pool of workers, one byte range each,
+    then puts the line numbers back together.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+    : workers - number of processes to use
+
+    Optional inputs:
+    : line_idx - the file's LineIndex - ranges are split and line numbers
+                 found with it instead of by reading the file
+
+    Yields each match, a range at a time, in line order.
+
+    Ranges are handed to the pool as earlier ones finish (never more than
+    workers at once), so when the caller stops early (a limit was hit)
+    the rest are never searched, and the few already running finish in
+    the background instead of being waited for.
+
+    """
+
+    logger.debug("Starting _iter_chunked()...")
+    parts = workers * _RANGES_PER_WORKER
+    parts = min(parts, os.path.getsize(file_in) // _MIN_CHUNK)
+    ranges = _line_ranges(file_in, max(parts, 1), line_idx)
+    logger.debug("Split '{}' into {} ranges".format(file_in, len(ranges)))
+
+    if len(ranges) == 1:
+        search = _range_search(pttrn, line_idx)
+        yield from search(file_in, pttrn, *ranges[0])
+        return
+
+    line_offset = 0
+    todo = iter(ranges)
+    pending = deque()
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(ranges)))
+    search = partial(pool.submit, _match_range, file_in, pttrn)
+    if line_idx is not None:
+        # workers open the sidecar themselves - a map does not pickle
+        search = partial(search, index_path=line_idx.index_path)
+
+    finished = False
+    try:
+        pending.extend(search(*bounds) for bounds in islice(todo, workers))
+        while pending:
+            matches, line_cnt = pending.popleft().result()
+            pending.extend(search(*bounds) for bounds in islice(todo, 1))
+            for num, line in matches:
+                yield str(int(num) + line_offset), line
+            line_offset += line_cnt
+        finished = True
+    finally:
+        pool.shutdown(wait=finished, cancel_futures=True)
+
+    logger.debug("... Ending _iter_chunked()")
+
+
+def _skip_class(pttrn, idx):
+    """
+    Returns the index just past the [...] class that starts at idx.
+
+    """
+
+    idx += 1
+    if pttrn.startswith("^", idx):
+        idx += 1
+    # a ] right at the start is part of the class
+    if pttrn.startswith("]", idx):
+        idx += 1
+    while idx < len(pttrn) and pttrn[idx] != "]":
+        idx += 2 if pttrn[idx] == "\\" else 1
+    return idx + 1
+
+
+def _skip_group(pttrn, idx):
+    """
+    Returns the index just past the (...) group that starts at idx.
+
+    """
+
+    depth = 0
+    while idx < len(pttrn):
+        char = pttrn[idx]
+        if char == "\\":
+            idx += 2
+            continue
+        if char == "[":
+            idx = _skip_class(pttrn, idx)
+            continue
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if not depth:
+                return idx + 1
+        idx += 1
+    return idx
+
+
+def _split_branches(pttrn):
+    """
+    Splits a pattern on the | characters that are not inside a group or
+    a class.
+
+    Returns a list of strings.
+
+    """
+
+    branches = []
+    begin = idx = 0
+    while idx < len(pttrn):
+        char = pttrn[idx]
+        if char == "\\":
+            idx += 2
+        elif char == "[":
+            idx = _skip_class(pttrn, idx)
+        elif char == "(":
+            idx = _skip_group(pttrn, idx)
+        elif char == "|":
+            branches.append(pttrn[begin:idx])
+            idx += 1
+            begin = idx
+        else:
+            idx += 1
+    branches.append(pttrn[begin:])
+    return branches
+
+
+def _escape_end(pttrn, idx):
+    """
+    Returns the index just past the escape whose backslash is at idx -
+    \\xhh, \\uXXXX, \\UXXXXXXXX, \\N{...}, octal and backreferences are all
+    longer than the backslash and one character.
+
+    """
+
+    kind = pttrn[idx + 1] if idx + 1 < len(pttrn) else ""
+    if kind in _ESCAPE_DIGITS:
+        return idx + 2 + _ESCAPE_DIGITS[kind]
+    if kind == "N" and pttrn.startswith("{", idx + 2):
+        close = pttrn.find("}", idx + 2)
+        return close + 1 if close != -1 else len(pttrn)
+    if kind.isdigit():
+        # like re - \0 or three octal digits is octal, else a backreference
+        digits = _OCTAL_RE.match(pttrn, idx + 1)
+        if kind == "0" or len(digits.group()) == 3:
+            return digits.end()
+        return _BACKREF_RE.match(pttrn, idx + 1).end()
+    return idx + 2
+
+
+def _literal_runs(branch):
+    """
+    Finds the runs of plain text a line MUST contain to match a branch.
+    Groups, classes and anything made optional by a quantifier are
+    skipped, which only ever makes the runs shorter - never wrong.
+
+    Returns a list of strings.
+
+    """
+
+    runs = [""]
+    idx = 0
+    while idx < len(branch):
+        char = branch[idx]
+        literal = None
+        step = 1
+        if char == "\\":
+            escaped = branch[idx + 1] if idx + 1 < len(branch) else ""
+            # \. \* \( ... are plain text, \w \d \b \x41 ... are not
+            if escaped and not escaped.isalnum():
+                literal = escaped
+            step = _escape_end(branch, idx) - idx
+        elif char == "[":
+            step = _skip_class(branch, idx) - idx
+        elif char == "(":
+            step = _skip_group(branch, idx) - idx
+        elif char == "{":
+            close = branch.find("}", idx)
+            step = close - idx + 1 if close != -1 else 1
+        elif char not in _REGEX_META:
+            literal = char
+
+        nxt = idx + step
+        quant = branch[nxt] if nxt < len(branch) else ""
+        if literal is not None and quant in ("?", "*", "{"):
+            literal = None
+
+        if literal is None:
+            runs.append("")
+        else:
+            runs[-1] += literal
+            if quant == "+":
+                runs.append("")
+        idx += step
+
+    return [run for run in runs if run]
+
+
+def _trigrams(text):
+    """
+    Returns the set of 3 character substrings in text.
+
+    """
+
+    return {text[idx:end] for idx, end in enumerate(range(3, len(text) + 1))}
+
+
+def _trigram_query(pttrn):
+    """
+    Works out which trigrams a line must have to possibly match pttrn.
+
+    Required inputs:
+    : pttrn - the regex pattern to be searched for
+
+    Returns a list with a set of trigrams per top level | branch (a line
+    needs all trigrams of at least one branch), or None if the index
+    cannot help with this pattern.
+
+    """
+
+    # inline flags like (?i) change what the literal text can match
+    if re.search(r"\(\?[aiLmsux-]", pttrn):
+        return None
+
+    query = []
+    for branch in _split_branches(pttrn):
+        grams = set()
+        for run in _literal_runs(branch):
+            grams |= _trigrams(run)
+        if not grams:
+            return None
+        query.append(grams)
+    return query
+
+
+def build_trigram_index(file_in, index_path=None):
+    """
+    Builds an on-disk trigram index of a txt file. Every 3 character
+    piece of text maps to the line numbers it shows up on, and every
+    line number maps to its byte offset in the file.
+
+    The file size and modified time are stored so a stale index can be
+    spotted and rebuilt.
+
+    Required inputs:
+    : file_in - a txt file to index
+
+    Optional inputs:
+    : index_path - where to save the index (default is next to file_in)
+
+    Returns the path of the index.
+
+    """
+
+    logger.debug("Starting build_trigram_index()...")
+    index_path = index_path or str(file_in) + ".tri"
+    stat = os.stat(file_in)
+    postings = {}
+    offsets = []
+
+    with open(file_in, "rb") as file_obj:
+        pos = 0
+        for line_cnt, raw in enumerate(file_obj):
+            offsets.append((line_cnt, pos))
+            pos += len(raw)
+            line = raw.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip()
+            for gram in _trigrams(line):
+                postings.setdefault(gram, array("I")).append(line_cnt)
+
+    Path(index_path).unlink(missing_ok=True)
+    with closing(sqlite3.connect(index_path)) as conn, conn:
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value)")
+        conn.execute("CREATE TABLE lines (num INTEGER PRIMARY KEY, pos)")
+        conn.execute("CREATE TABLE postings (gram TEXT PRIMARY KEY, nums)")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("size", stat.st_size), ("mtime_ns", stat.st_mtime_ns)],
+        )
+        conn.executemany("INSERT INTO lines VALUES (?, ?)", offsets)
+        conn.executemany(
+            "INSERT INTO postings VALUES (?, ?)",
+            ((gram, nums.tobytes()) for gram, nums in postings.items()),
+        )
+
+    logger.debug("... Ending build_trigram_index()")
+    return index_path
+
+
+def _open_trigram_index(file_in, index_path=None):
+    """
+    Opens the trigram index for file_in, (re)building it first if it is
+    missing or the file changed size or modified time since.
+
+    Returns an open sqlite3 connection.
+
+    """
+
+    index_path = index_path or str(file_in) + ".tri"
+    stat = os.stat(file_in)
+    if Path(index_path).is_file():
+        conn = sqlite3.connect(index_path)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError:
+            meta = {}
+        if meta == {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}:
+            return conn
+        conn.close()
+        logger.info("Trigram index is stale - rebuilding:  " + index_path)
+
+    return sqlite3.connect(build_trigram_index(file_in, index_path))
+
+
+def _iter_indexed(file_in, pttrn, index_path=None, matches=None):
+    """
+    Uses the trigram index to pick the lines that could match, then runs
+    the real regex on just those lines.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+
+    Optional inputs:
+    : index_path - where the index is kept (default is next to file_in)
+    : matches - the line check to use (default is _matcher(pttrn))
+
+    Yields each match.
+
+    """
+
+    logger.debug("Starting _iter_indexed()...")
+    matches = matches or _matcher(pttrn)
+    candidates = set()
+
+    with closing(_open_trigram_index(file_in, index_path)) as conn:
+        for grams in _trigram_query(pttrn):
+            rows = conn.execute(
+                "SELECT nums FROM postings WHERE gram IN ({})".format(
+                    ",".join("?" * len(grams))
+                ),
+                list(grams),
+            ).fetchall()
+            # a trigram that is nowhere in the file rules the branch out
+            if len(rows) < len(grams):
+                continue
+
+            # start from the shortest list to keep the set small
+            postings = [array("I", row[0]) for row in rows]
+            postings.sort(key=len)
+            found = set(postings[0])
+            for nums in postings[1:]:
+                found.intersection_update(nums)
+            candidates |= found
+
+        candidates = sorted(candidates)
+        offsets = {}
+        for begin in range(0, len(candidates), _SQL_BATCH):
+            end = begin + _SQL_BATCH
+            batch = candidates[begin:end]
+            offsets.update(
+                conn.execute(
+                    "SELECT num, pos FROM lines WHERE num IN ({})".format(
+                        ",".join("?" * len(batch))
+                    ),
+                    batch,
+                )
+            )
+
+    logger.debug("{} candidate lines from index".format(len(candidates)))
+    with open(file_in, "rb") as file_obj:
+        for line_cnt in candidates:
+            file_obj.seek(offsets[line_cnt])
+            raw = file_obj.readline()
+            line = raw.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip()
+            if matches(line):
+                yield str(line_cnt), line
+
+    logger.debug("... Ending _iter_indexed()")
+
+
+def _ascii_compatible(encoding):
+    """
+    Checks if an encoding writes ASCII (and so newlines and every safe
+    pattern) as the same single bytes UTF-8 does.
+
+    Returns a boolean.
+
+    """
+
+    try:
+        return "\n.aZ09".encode(encoding) == b"\n.aZ09"
+    except LookupError:
+        return False
+
+
+def _decodes_as_mmap(encoding, errors):
+    """
+    Checks if the encoding / errors asked for decode bytes the same way as
+    the mmap, process pool and trigram index searches do (UTF-8, bad bytes
+    replaced) - those paths have no encoding of their own.
+
+    Returns a boolean.
+
+    """
+
+    if errors not in (None, _DECODE_ERRORS):
+        return False
+    if encoding is None:
+        return True
+    try:
+        return codecs.lookup(encoding).name == _MMAP_ENCODING
+    except LookupError:
+        return False
+
+
+def _bytes_safe(pttrn, encoding, errors):
+    """
+    Checks if a line by line bytes search finds every line a str search
+    would. Besides a buffer safe pattern that needs an ASCII compatible
+    encoding, and bad bytes have to turn into U+FFFD (or raise) - with
+    "ignore" the bytes pattern could miss text joined up by the decode.
+
+    Returns a boolean.
+
+    """
+
+    if errors not in ("strict", "replace") or "\ufffd" in pttrn:
+        return False
+    if not (_ascii_compatible(encoding) and _buffer_safe(pttrn)):
+        return False
+    try:
+        return pttrn.encode(encoding).decode(encoding) == pttrn
+    except UnicodeError:
+        return False
+
+
+def _scan_raw(raw_lines, pttrn, encoding, errors, matches=None):
+    """
+    Checks raw (undecoded) lines for the pattern. When the pattern is
+    bytes safe a bytes regex looks at each line first and only the lines
+    it hits get decoded - otherwise every line is decoded.
+
+    Required inputs:
+    : raw_lines - an iterable of bytes lines
+    : pttrn - a string to match against each line
+    : encoding / errors - how to decode the lines
+
+    Optional inputs:
+    : matches - the line check to use (default is _matcher(pttrn), a
+                custom check also turns off the bytes pre-check)
+
+    Yields each match.
+
+    """
+
+    found = None
+    if matches is None:
+        matches = _matcher(pttrn)
+        if _bytes_safe(pttrn, encoding, errors):
+            raw_pttrn = pttrn.encode(encoding)
+            if _is_literal(pttrn):
+                # re runs an escaped literal as a plain substring scan
+                raw_pttrn = re.escape(raw_pttrn)
+            found = _compile(raw_pttrn).search
+
+    line_cnt = 0
+    for raw in raw_lines:
+        # check the str line too - rstrip() drops more than bytes do
+        if found is None or found(raw):
+            line = raw.decode(encoding, errors).rstrip()
+            if matches(line):
+                yield str(line_cnt), line
+
+        line_cnt += 1
+
+
+def _iter_bytes(file_in, pttrn, encoding, errors):
+    """
+    Line by line search on the raw bytes - a line is only decoded once
+    the bytes pattern has found something in it.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+    : encoding / errors - how to decode the lines that match
+
+    Yields each match.
+
+    """
+
+    with open(file_in, "rb") as file_obj:
+        yield from _scan_raw(file_obj, pttrn, encoding, errors)
+
+
+def _compressed_opener(file_in):
+    """
+    Looks at the first few bytes of a file for a compression format's
+    magic number (the file name is not trusted).
+
+    Returns the open() function for the format, or None for a plain file.
+
+    """
+
+    with open(file_in, "rb") as file_obj:
+        head = file_obj.read(_MAGIC_LEN)
+
+    for magic, fmt in _MAGIC:
+        if magic.match(head):
+            if _OPENERS[fmt] is None:
+                raise ImportError(
+                    "{} files need Python 3.14+ (compression.zstd)".format(fmt)
+                )
+            return _OPENERS[fmt]
+    return None
+
+
+def _put(blocks, item, stop):
+    """
+    Puts an item on a bounded queue, giving up if the reader has stopped.
+
+    Returns a boolean (False when stopped).
+
+    """
+
+    while not stop.is_set():
+        try:
+            blocks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _decompressed_blocks(file_in, opener):
+    """
+    Decompresses a file in a background thread, handing blocks over
+    through a bounded queue - the thread decompresses the next blocks
+    while the caller searches this one, and never more than
+    _DECOMP_QUEUE blocks are held in memory.
+
+    Required inputs:
+    : file_in - a compressed file
+    : opener - gzip.open, bz2.open ... (see _compressed_opener())
+
+    Yields blocks of decompressed bytes. Errors in the thread (a broken
+    or cut off archive) are raised here as an IOError saying so.
+
+    """
+
+    blocks = queue.Queue(maxsize=_DECOMP_QUEUE)
+    stop = threading.Event()
+
+    def decompress():
+        last = None
+        try:
+            with opener(file_in, "rb") as file_obj:
+                read = partial(file_obj.read, _DECOMP_BLOCK)
+                for block in iter(read, b""):
+                    if not _put(blocks, block, stop):
+                        return
+        except Exception as err:
+            last = err
+        _put(blocks, last, stop)
+
+    worker = threading.Thread(target=decompress, daemon=True)
+    worker.start()
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                break
+            if isinstance(block, Exception):
+                msg = "Could not decompress {}:  {}".format(file_in, block)
+                raise IOError(msg) from block
+            yield block
+    finally:
+        # also runs when the caller stops early - lets the thread finish
+        stop.set()
+        worker.join()
+
+
+def _split_blocks(blocks):
+    """
+    Cuts blocks of bytes back up into lines.
+
+    Yields each line (without the newline).
+
+    """
+
+    tail = b""
+    for block in blocks:
+        lines = (tail + block).split(b"\n")
+        tail = lines.pop()
+        yield from lines
+
+    if tail:
+        yield tail
+
+
+def _iter_compressed(
+    file_in,
+    pttrn,
+    opener,
+    matches=None,
+    encoding=None,
+    errors=None,
+):
+    """
+    Line by line search over a compressed file, decompressed on the fly
+    - nothing is written to disk.
+
+    Required inputs:
+    : file_in - a .gz / .bz2 / .xz / .zst file
+    : pttrn - a string to match against the decompressed lines
+    : opener - gzip.open, bz2.open ... (see _compressed_opener())
+
+    Optional inputs:
+    : matches - the line check to use (default is _matcher(pttrn))
+    : encoding / errors - how to decode the lines (default is UTF-8)
+
+    Yields each match.
+
+    """
+
+    encoding = encoding or _MMAP_ENCODING
+    errors = errors or _DECODE_ERRORS
+    lines = _split_blocks(_decompressed_blocks(file_in, opener))
+    yield from _scan_raw(lines, pttrn, encoding, errors, matches)
+
+
+def _iter_lines(file_in, pttrn, matches=None, encoding=None, errors=None):
+    """
+    The plain line by line search - every line is read in as text and
+    checked for the pattern.
+
+    Optional inputs:
+    : matches - the line check to use (default is _matcher(pttrn))
+    : encoding / errors - passed to open() (default is the locale's
+                          encoding, replacing bytes it cannot decode)
+
+    Yields each match.
+
+    """
+
+    matches = matches or _matcher(pttrn)
+    line_cnt = 0
+    errors = errors or _DECODE_ERRORS
+    with open(file_in, "r", encoding=encoding, errors=errors) as file_in:
+        for line in file_in:
+            # str.rstrip([chars])
+            line = str.rstrip(line)
+
+            # pattern in line for plain text, a regex search otherwise
+            if matches(line):
+                yield str(line_cnt), line
+
+            line_cnt += 1
+
+
+def _iter_context(
+    file_in,
+    pttrn,
+    before,
+    after,
+    opener=None,
+    matches=None,
+    encoding=None,
+    errors=None,
+):
+    """
+    Line by line search that also hands back the lines around each match.
+    The last `before` lines are kept in a ring buffer (a deque with a
+    maxlen), so the file is only read once, and a line that is in more
+    than one window is only handed back once.
+
+    Required inputs:
+    : file_in - a txt (or compressed, see opener) file
+    : pttrn - a string to match against line in file_in
+    : before / after - how many lines to show before / after a match
+
+    Optional inputs:
+    : opener - gzip.open, bz2.open ... for a compressed file
+    : matches - the line check to use (default is _matcher(pttrn))
+    : encoding / errors - how to decode the lines
+
+    Yields (line number, line, is match) tuples.
+
+    """
+
+    matches = matches or _matcher(pttrn)
+    errors = errors or _DECODE_ERRORS
+
+    window = deque(maxlen=before)
+    owed = 0  # lines still to show after the last match
+    with closing(_read_lines(file_in, opener, encoding, errors)) as lines:
+        for line_cnt, line in enumerate(lines):
+            line = line.rstrip()
+            if matches(line):
+                for num, text in window:
+                    yield str(num), text, False
+                window.clear()
+                yield str(line_cnt), line, True
+                owed = after
+            elif owed:
+                yield str(line_cnt), line, False
+                owed -= 1
+            else:
+                window.append((line_cnt, line))
+
+
+def _read_lines(file_in, opener, encoding, errors):
+    """
+    Every line of a plain or compressed file, as text.
+
+    Yields each line.
+
+    """
+
+    if opener is None:
+        with open(file_in, "r", encoding=encoding, errors=errors) as file_obj:
+            yield from file_obj
+    else:
+        encoding = encoding or _MMAP_ENCODING
+        for raw in _split_blocks(_decompressed_blocks(file_in, opener)):
+            yield raw.decode(encoding, errors)
+
+
+def iter_matches(
+    file_in,
+    pttrn,
+    mmap_mode=False,
+    workers=1,
+    index=False,
+    engine="re",
+    max_steps=None,
+    timeout=None,
+    bytes_mode=False,
+    encoding=None,
+    errors=None,
+    before=0,
+    after=0,
+    line_index=False,
+):
+    """
+    Same search as read_n_match(), but hands back every match as soon as
+    it is found instead of collecting them in a list. Memory use stays
+    flat no matter how many lines match.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+
+    Optional inputs:
+    : mmap_mode - search the whole memory-mapped file in one pass
+                  (UTF-8 only, falls back to line by line if the pattern
+                  cannot safely be run over raw bytes or another encoding
+                  or errors is asked for)
+    : workers - split the file into line-aligned byte ranges and search
+                them in this many processes (UTF-8 only, like mmap_mode)
+    : index - use (and build or refresh if needed) an on-disk trigram
+              index to only look at lines that could match - pass a
+              path to keep the index somewhere other than next to file_in
+              (UTF-8 only, like mmap_mode)
+    : engine - "re" (default) or "linear" - the linear time engine can
+               not get stuck backtracking on patterns like (a+)+$ but
+               only handles the regular part of re's syntax, and always
+               reads line by line (mmap_mode and workers are ignored)
+    : max_steps / timeout - budget for the whole search on the linear
+                            engine, in NFA steps / seconds
+    : bytes_mode - read the file as raw bytes and only decode the lines
+                   the pattern hits (falls back to decoding every line
+                   if the pattern or encoding does not allow it)
+    : encoding - the file's encoding (default is UTF-8 in bytes_mode
+                 and the locale's encoding otherwise)
+    : errors - what to do with bytes that do not decode, see
+               bytes.decode() (default is "replace", so a bad byte
+               becomes U+FFFD instead of stopping the search)
+    : before / after - also hand back this many lines before / after each
+                       match (read line by line in one pass - mmap_mode,
+                       workers, index and bytes_mode do not apply)
+    : line_index - with mmap_mode or workers, look line numbers up in
+                   (and split the file for workers on) an on-disk
+                   LineIndex instead of counting newlines - pass a path
+                   to keep it somewhere other than next to file_in
+
+    gzip, bz2, xz and zstd (Python 3.14+) files are spotted by their
+    magic number and decompressed on the fly in a background thread -
+    mmap_mode, workers and index do not apply to them, and they are
+    decoded as UTF-8 unless an encoding is given.
+
+    Line endings:  the plain line by line search reads in text mode, so a
+    lone \r (old Mac line ending) also ends a line. Every search that
+    reads raw bytes - mmap_mode, workers, index, bytes_mode, compressed
+    files, compact results and the search service - only ends lines at
+    \n (the \r of \r\n is stripped), so on a file with lone \r endings
+    those lines come back joined up, with later line numbers lower.
+
+    Yields (line number, line) tuples - or (line number, line, is match)
+    tuples when asking for context lines. Unlike read_n_match(), an IOError
+    (or a TimeoutError when the budget runs out) is raised to the caller.
+
+    """
+
+    logger.debug("Starting iter_matches()...")
+    if engine not in ("re", "linear"):
+        raise ValueError("engine must be 're' or 'linear'")
+
+    matches = None
+    if engine == "linear":
+        matches = _linear_matcher(pttrn, max_steps, timeout)
+        if mmap_mode or workers > 1:
+            logger.info("Linear engine reads line by line.")
+            mmap_mode = False
+            workers = 1
+        bytes_mode = False
+    if mmap_mode and not _buffer_safe(pttrn):
+        logger.info("Pattern not mmap safe - reading by line:  " + pttrn)
+        mmap_mode = False
+
+    if index and _trigram_query(pttrn) is None:
+        logger.info("Pattern has no trigrams to look up - full scan.")
+        index = False
+
+    utf8_only = mmap_mode or workers > 1 or index
+    if utf8_only and not _decodes_as_mmap(encoding, errors):
+        logger.info("Not UTF-8 with replaced errors - reading line by line.")
+        mmap_mode = False
+        workers = 1
+        index = False
+
+    errors = errors or _DECODE_ERRORS
+    if bytes_mode:
+        encoding = encoding or _MMAP_ENCODING
+        if not _bytes_safe(pttrn, encoding, errors):
+            logger.info("Pattern not bytes safe - decoding every line.")
+            bytes_mode = False
+
+    logger.debug("Attempting to read in TXT file:  '{}'".format(file_in))
+    opener = _compressed_opener(file_in)
+    if before or after:
+        if index or workers > 1 or mmap_mode or bytes_mode:
+            logger.info("Context lines - reading line by line.")
+        yield from _iter_context(
+            file_in,
+            pttrn,
+            before,
+            after,
+            opener,
+            matches=matches,
+            encoding=encoding,
+            errors=errors,
+        )
+    elif opener is not None:
+        if index or workers > 1 or mmap_mode:
+            logger.info("Compressed file - streaming it line by line.")
+        yield from _iter_compressed(
+            file_in, pttrn, opener, matches, encoding=encoding, errors=errors
+        )
+    elif index:
+        index_path = None if index is True else str(index)
+        yield from _iter_indexed(file_in, pttrn, index_path, matches)
+    elif workers > 1 or mmap_mode:
+        line_idx = None
+        if line_index:
+            index_path = None if line_index is True else str(line_index)
+            line_idx = LineIndex(file_in, index_path)
+        with nullcontext() if line_idx is None else line_idx:
+            if workers > 1:
+                yield from _iter_chunked(file_in, pttrn, workers, line_idx)
+            else:
+                yield from _iter_mmap(file_in, pttrn, line_idx=line_idx)
+    elif bytes_mode:
+        yield from _iter_bytes(file_in, pttrn, encoding, errors)
+    else:
+        yield from _iter_lines(file_in, pttrn, matches, encoding, errors)
+
+    logger.debug("... Ending iter_matches()")
+
+
+def _iter_spans(
+    file_in,
+    pttrn,
+    engine="re",
+    max_steps=None,
+    timeout=None,
+    encoding=None,
+    errors=None,
+    **ignored,
+):
+    """
+    Finds the matching lines, but hands back where they are in the file
+    instead of the lines themselves (see MatchSet).
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+
+    Optional inputs:
+    : engine / max_steps / timeout - see iter_matches()
+    : encoding / errors - how to decode the lines (default is UTF-8)
+    : ignored - other iter_matches() options, which do not apply here
+
+    Yields (line number, start, end) tuples of ints.
+
+    """
+
+    if ignored:
+        unused = ", ".join(sorted(ignored))
+        logger.info("Not used for compact results:  " + unused)
+    matches = None
+    if engine == "linear":
+        matches = _linear_matcher(pttrn, max_steps, timeout)
+
+    encoding = encoding or _MMAP_ENCODING
+    errors = errors or _DECODE_ERRORS
+    utf8 = encoding.lower().replace("_", "-") in ("utf-8", "utf8")
+    if matches is None and utf8 and _buffer_safe(pttrn):
+        yield from _iter_mmap(file_in, pttrn, spans=True)
+        return
+
+    matches = matches or _matcher(pttrn)
+    with open(file_in, "rb") as file_obj:
+        pos = 0
+        for line_cnt, raw in enumerate(file_obj):
+            end = pos + len(raw.rstrip(b"\n"))
+            if matches(raw.decode(encoding, errors).rstrip()):
+                yield line_cnt, pos, end
+            pos += len(raw)
+
+
+class MatchSet(object):
+    """
+    Compact read_n_match() results. Instead of a tuple, a str line number
+    and a copy of the line per match, only the line number, byte offset
+    and length are kept - in three array("Q")s, so 24 bytes a match. A
+    line's text is read back out of the (memory-mapped) file only when
+    it is asked for.
+
+    len(), iteration and indexing work like on the list read_n_match()
+    returns and give the same (line number, line) tuples, so a MatchSet
+    can be handed straight to print_to_file().
+
+    """
+
+    def __init__(self, file_in, encoding=None, errors=None):
+        """
+        Starts an empty set of matches for file_in.
+
+        Required inputs:
+        : file_in - the txt file the matches are in
+
+        Optional inputs:
+        : encoding / errors - how to decode the lines (default is UTF-8)
+
+        """
+
+        self.file_in = str(file_in)
+        self.encoding = encoding or _MMAP_ENCODING
+        self.errors = errors or _DECODE_ERRORS
+        self.line_nums = array("Q")
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        self._map = None
+
+        # the offsets are only good for the file as it is now
+        stat = os.stat(self.file_in)
+        self._stamp = (stat.st_size, stat.st_mtime_ns)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.line_nums)
+
+    def __iter__(self):
+        for idx in range(len(self.line_nums)):
+            yield str(self.line_nums[idx]), self.line(idx)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[num] for num in range(*idx.indices(len(self)))]
+        return str(self.line_nums[idx]), self.line(idx)
+
+    def append(self, num, start, end):
+        """
+        Adds a match - line num, found between byte offsets start and end.
+
+        """
+
+        self.line_nums.append(num)
+        self.offsets.append(start)
+        self.lengths.append(end - start)
+
+    def close(self):
+        """
+        Lets go of the memory-mapped file (it is mapped again if needed).
+
+        """
+
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def line(self, idx):
+        """
+        Reads the text of match idx out of the file.
+
+        Returns the line (decoded and rstripped like read_n_match() does).
+
+        """
+
+        if self._map is None:
+            with open(self.file_in, "rb") as file_obj:
+                stat = os.fstat(file_obj.fileno())
+                if (stat.st_size, stat.st_mtime_ns) != self._stamp:
+                    msg = "'{}' changed since it was searched"
+                    raise ValueError(msg.format(self.file_in))
+                fileno = file_obj.fileno()
+                self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+
+        start = self.offsets[idx]
+        end = start + self.lengths[idx]
+        raw = self._map[start:end]
+        return raw.decode(self.encoding, self.errors).rstrip()
+
+
+class ResultCache(object):
+    """
+    An on-disk (SQLite) cache of read_n_match() results. Entries are keyed
+    on the file's path, size and mtime_ns (plus, optionally, a hash of
+    its contents), the pattern and the search options, so a changed file
+    never hands back old results. Once the cache holds more than
+    max_bytes of results the least recently used ones are dropped.
+
+    """
+
+    def __init__(self, cache_path=None, max_bytes=None, hash_content=False):
+        """
+        Opens (or creates) the cache.
+
+        Optional inputs:
+        : cache_path - the SQLite file (default is _CACHE_PATH)
+        : max_bytes - total size of the stored results to keep it under
+                      (default is _CACHE_MAX_BYTES)
+        : hash_content - also key on a hash of the file's contents, for
+                         files that can change without a new mtime
+
+        """
+
+        self.cache_path = str(cache_path or _CACHE_PATH)
+        self.max_bytes = max_bytes or _CACHE_MAX_BYTES
+        self.hash_content = hash_content
+        logger.debug("Opening result cache:  '{}'".format(self.cache_path))
+
+        self._db = sqlite3.connect(self.cache_path)
+        with self._db:
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result BLOB NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    used INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS results_used ON results (used);
+                CREATE TABLE IF NOT EXISTS stats (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                );
+                INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0);
+                """
+            )
+            # max_bytes may be smaller than last time
+            self._evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Closes the SQLite connection.
+
+        """
+
+        self._db.close()
+
+    def key(self, file_in, pttrn, options):
+        """
+        Works out the cache key for a search.
+
+        Required inputs:
+        : file_in - the txt file being searched
+        : pttrn - the pattern
+        : options - the read_n_match() options (values JSON has no type
+                    for, like a Path, are keyed on their str())
+
+        Returns a hex string. Raises an IOError if file_in is missing.
+
+        """
+
+        stat = os.stat(file_in)
+        digest = None
+        if self.hash_content:
+            content = hashlib.sha256()
+            with open(file_in, "rb") as file_obj:
+                for block in iter(partial(file_obj.read, _COUNT_BLOCK), b""):
+                    content.update(block)
+            digest = content.hexdigest()
+
+        parts = [
+            os.path.abspath(file_in),
+            stat.st_size,
+            stat.st_mtime_ns,
+            digest,
+            pttrn,
+            options,
+        ]
+        text = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _bump(self, name):
+        sql = "UPDATE stats SET value = value + 1 WHERE name = ?"
+        self._db.execute(sql, (name,))
+
+    def _next_use(self):
+        row = self._db.execute("SELECT MAX(used) FROM results").fetchone()
+        return (row[0] or 0) + 1
+
+    def get(self, key):
+        """
+        Looks a search up, and marks it as just used.
+
+        Returns the cached result, or None if it is not in the cache.
+
+        """
+
+        with self._db:
+            row = self._db.execute(
+                "SELECT result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._bump("misses")
+                return None
+
+            self._bump("hits")
+            self._db.execute(
+                "UPDATE results SET used = ? WHERE key = ?",
+                (self._next_use(), key),
+            )
+
+        found = json.loads(zlib.decompress(row[0]).decode("utf-8"))
+        if isinstance(found, int):
+            return found
+        if isinstance(found, dict):
+            return found["count"], bytearray.fromhex(found["bitmap"])
+        return [tuple(item) for item in found]
+
+    def put(self, key, result):
+        """
+        Stores a result (a list of matches, or a count with or without
+        its bitmap), then drops old entries until it fits in max_bytes.
+
+        """
+
+        if isinstance(result, tuple):
+            result = {"count": result[0], "bitmap": result[1].hex()}
+        blob = zlib.compress(json.dumps(result).encode("utf-8"))
+        if len(blob) > self.max_bytes:
+            logger.info("Result too big to cache:  {}".format(len(blob)))
+            return
+
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, blob, len(blob), self._next_use()),
+            )
+            self._evict()
+
+    def _evict(self):
+        """
+        Drops the least recently used results until the total size of
+        the cache is back under max_bytes.
+
+        """
+
+        total = self._db.execute("SELECT SUM(bytes) FROM results").fetchone()
+        extra = (total[0] or 0) - self.max_bytes
+        if extra <= 0:
+            return
+
+        oldest = self._db.execute(
+            "SELECT key, bytes FROM results ORDER BY used"
+        ).fetchall()
+        dropped = []
+        for key, size in oldest:
+            if extra <= 0:
+                break
+            dropped.append((key,))
+            extra -= size
+        logger.debug("Dropping {} cached results".format(len(dropped)))
+        self._db.executemany("DELETE FROM results WHERE key = ?", dropped)
+
+    def stats(self):
+        """
+        How well the cache is doing.
+
+        Returns a dictionary of hits, misses, bytes (total size of the
+        stored results) and entries.
+
+        """
+
+        found = dict(self._db.execute("SELECT name, value FROM stats"))
+        row = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM results"
+        ).fetchone()
+        found["entries"], found["bytes"] = row
+        return found
+
+    def clear(self):
+        """
+        Empties the cache and resets the stats.
+
+        """
+
+        with self._db:
+            self._db.execute("DELETE FROM results")
+            self._db.execute("UPDATE stats SET value = 0")
+
+
+def _cached_read(cache, file_in, pttrn, options):
+    """
+    read_n_match() through a ResultCache - a search is only run (and
+    stored) when it is not already in the cache.
+
+    Required inputs:
+    : cache - True (the default cache), a cache file path or a ResultCache
+    : file_in / pttrn / options - the read_n_match() arguments
+
+    Returns what read_n_match() returns. A search that stopped on an
+    IOError is logged and handed back, but not stored.
+
+    """
+
+    if isinstance(cache, ResultCache):
+        opened = None
+    else:
+        opened = cache = ResultCache(None if cache is True else cache)
+
+    try:
+        try:
+            key = cache.key(file_in, pttrn, options)
+        except IOError:
+            # let the plain search log the missing file
+            return _read_n_match(file_in, pttrn, **options)[0]
+
+        found = cache.get(key)
+        if found is None:
+            found, finished = _read_n_match(file_in, pttrn, **options)
+            if finished:
+                cache.put(key, found)
+        return found
+    finally:
+        if opened is not None:
+            opened.close()
+
+
+def _mark_line(line_map, num):
+    """
+    Sets bit num of a bytearray bitmap (bit 0 is the low bit of byte 0),
+    growing it as needed.
+
+    """
+
+    byte = num >> 3
+    if byte >= len(line_map):
+        line_map.extend(bytes(byte + 1 - len(line_map)))
+    line_map[byte] |= 1 << (num & 7)
+
+
+def read_n_match(
+    file_in,
+    pttrn,
+    count_only=False,
+    bitmap=False,
+    limit=None,
+    offset=0,
+    compact=False,
+    cache=None,
+    **options,
+):
+    """
+    Reads in a txt file. Will attempt to match an input pattern,
+    and if found add to a list.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pattern - a string to match against line in file_in
+
+    Optional inputs:
+    : count_only - only count the matching lines, none are kept
+    : bitmap - with count_only, also return a bytearray with bit N set
+               if line N matched (bits past the last match are 0)
+    : limit - stop reading the file after this many matches (limit=1
+              is a quick "is there any match" check)
+    : offset - skip this many matches first (for paging with limit)
+    : compact - return a MatchSet (offsets into the file, lines read back
+                when needed) instead of a list - the file is searched
+                line by line or memory-mapped, other options do not apply
+                (compressed files have no offsets to keep, so they still
+                come back as a list)
+    : cache - look the search up in (and add it to) a ResultCache - pass
+              True for the default one, a path or a ResultCache (not
+              used for compact results or searches with a time budget)
+    : options - how to search (mmap_mode, workers, index, engine ...),
+                see iter_matches() - before / after add context lines
+                (limit / offset then count context lines too)
+
+    Returns a list (or MatchSet) - or the count (and bitmap) for
+    count_only.
+
+    """
+
+    no_budget = "max_steps" not in options and "timeout" not in options
+    options.update(count_only=count_only, bitmap=bitmap)
+    options.update(limit=limit, offset=offset, compact=compact)
+    if cache and not compact and no_budget:
+        return _cached_read(cache, file_in, pttrn, options)
+    return _read_n_match(file_in, pttrn, **options)[0]
+
+
+def _read_n_match(
+    file_in,
+    pttrn,
+    count_only=False,
+    bitmap=False,
+    limit=None,
+    offset=0,
+    compact=False,
+    **options,
+):
+    """
+    The search behind read_n_match() - takes the same arguments, less
+    cache.
+
+    Returns read_n_match()'s result and whether the search finished
+    (False if an IOError, or the time budget running out, stopped it).
+
+    """
+
+    logger.debug("Starting read_n_match()...")
+    finished = False
+    lines_list = []
+    line_cnt = 0
+    line_map = bytearray() if bitmap else None
+    stop = None if limit is None else offset + limit
+
+    try:
+        # closing() stops the search as soon as limit is reached - a
+        # decompressing thread or the process pool behind it only finish
+        # the block / byte ranges already in progress
+        if compact and _compressed_opener(file_in) is not None:
+            logger.info("Compressed file - no offsets, returning a list.")
+            compact = False
+        if compact and not count_only:
+            encoding = options.get("encoding")
+            errors = options.get("errors")
+            lines_list = MatchSet(file_in, encoding, errors)
+            with closing(_iter_spans(file_in, pttrn, **options)) as spans:
+                for num, start, end in islice(spans, offset, stop):
+                    lines_list.append(num, start, end)
+        else:
+            with closing(iter_matches(file_in, pttrn, **options)) as found:
+                found = islice(found, offset, stop)
+                if not count_only:
+                    lines_list.extend(found)
+                for item in found:
+                    if item[2:3] == (False,):
+                        continue
+                    line_cnt += 1
+                    if line_map is not None:
+                        _mark_line(line_map, int(item[0]))
+        finished = True
+    # TimeoutError is a kind of IOError, so it has to be caught first
+    except TimeoutError as err:
+        logger.error("{} Returning what was found so far.".format(err))
+    except FileNotFoundError:
+        logger.critical("File does not exist.")
+    except IOError as err:
+        logger.critical(err)
+
+    logger.debug("... Ending read_n_match()")
+    if not count_only:
+        return lines_list, finished
+    if bitmap:
+        return (line_cnt, line_map), finished
+    return line_cnt, finished
+
+
+def _expand_paths(paths_or_globs, suffix=".txt"):
+    """
+    Turns a mix of file paths, directories and glob patterns into a
+    sorted list of files. Directories are searched for TXT files.
+
+    Required inputs:
+    : paths_or_globs - a path / glob string, or an iterable of them
+
+    Optional inputs:
+    : suffix - the kind of file to look for in directories
+
+    Returns a list of file names (no duplicates, in a fixed order).
+
+    """
+
+    if isinstance(paths_or_globs, (str, Path)):
+        paths_or_globs = [paths_or_globs]
+
+    files = []
+    for item in paths_or_globs:
+        path = Path(item)
+        if path.is_dir():
+            found = [str(p) for p in path.rglob("*" + suffix) if p.is_file()]
+        elif path.is_file():
+            found = [str(path)]
+        else:
+            found = [
+                name
+                for name in glob.glob(str(item), recursive=True)
+                if Path(name).is_file()
+            ]
+            if not found:
+                logger.warning("Nothing found for:  '{}'".format(item))
+        files.extend(sorted(found))
+
+    # dict keeps insertion order, so this drops duplicates in place
+    return list(dict.fromkeys(files))
+
+
+def read_n_match_many(paths_or_globs, pttrn, workers=None, mmap_mode=False):
+    """
+    Runs read_n_match() over many files, spreading the files across a
+    pool of worker processes.
+
+    Required inputs:
+    : paths_or_globs - file(s), directory tree(s) or glob pattern(s)
+    : pttrn - a string to match against the lines in every file
+
+    Optional inputs:
+    : workers - number of processes (default is one per CPU)
+    : mmap_mode - passed along to read_n_match()
+
+    Yields (file name, list of matches) per file, in the same order as
+    the files were found - no matter which worker finishes first.
+
+    """
+
+    logger.debug("Starting read_n_match_many()...")
+    files = _expand_paths(paths_or_globs)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(files))
+    logger.debug("Searching {} files".format(len(files)))
+
+    if workers <= 1:
+        for name in files:
+            yield name, read_n_match(name, pttrn, mmap_mode=mmap_mode)
+    else:
+        # hand out files in batches to keep the back and forth down
+        chunksize = max(1, len(files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            search = partial(read_n_match, pttrn=pttrn, mmap_mode=mmap_mode)
+            results = pool.map(search, files, chunksize=chunksize)
+            yield from zip(files, results)
+
+    logger.debug("... Ending read_n_match_many()")
+
+
+class _AhoCorasick(object):
+    """
+    Aho-Corasick automaton - finds every one of many plain text strings
+    in a single pass over a line, however many strings there are.
+
+    """
+
+    def __init__(self, words):
+        """
+        Builds the trie of words, then the fail links (where to carry on
+        from when the next character does not fit) breadth first.
+
+        """
+
+        self._goto = [{}]
+        self._out = [set()]
+        for word in words:
+            state = 0
+            for char in word:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._out.append(set())
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._out[state].add(word)
+
+        self._fail = [0] * len(self._goto)
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for char, nxt in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[nxt] = fail if fail != nxt else 0
+                # a state also ends every word its fail state ends
+                self._out[nxt] |= self._out[self._fail[nxt]]
+                queue.append(nxt)
+
+    def search(self, text):
+        """
+        Returns the set of words found anywhere in text.
+
+        """
+
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+def _load_patterns(pttrns):
+    """
+    Gets the list of patterns for a batch search.
+
+    Required inputs:
+    : pttrns - a file name (one pattern per line) or an iterable of them
+
+    Returns a list of patterns (no blanks or duplicates, in order).
+
+    """
+
+    if isinstance(pttrns, (str, Path)):
+        with open(pttrns, "r") as pttrn_file:
+            pttrns = [line.rstrip("\r\n") for line in pttrn_file]
+        pttrns = [pttrn for pttrn in pttrns if pttrn]
+    return list(dict.fromkeys(pttrns))
+
+
+def _multi_matcher(pttrns):
+    """
+    Builds one check for a whole list of patterns:
+      - plain text goes into an Aho-Corasick automaton, behind one
+        combined regex that quickly skips lines with none of them
+      - regexes go into one alternation of named groups, so a line only
+        gets checked against each regex once the alternation hits
+      - regexes that cannot be combined (numbered backreferences or
+        flags) are checked on their own
+
+    Required inputs:
+    : pttrns - list of patterns
+
+    Returns a function that takes a line and returns a tuple of the
+    patterns that matched it, in the order they were given.
+
+    """
+
+    literals = [pttrn for pttrn in pttrns if _is_literal(pttrn) and pttrn]
+    regexes = [pttrn for pttrn in pttrns if pttrn not in literals]
+    order = {pttrn: idx for idx, pttrn in enumerate(pttrns)}
+    # compile every regex now, so a bad one fails before any reading
+    checks = {pttrn: _matcher(pttrn) for pttrn in regexes}
+
+    lit_re = automaton = None
+    if literals:
+        automaton = _AhoCorasick(literals)
+        lit_re = _compile("|".join(re.escape(lit) for lit in literals))
+
+    # \1 would point at the wrong group and (?i) must start the pattern
+    uncombinable = re.compile(r"\\[1-9]|\(\?[aiLmsux-]")
+    combined = [pttrn for pttrn in regexes if not uncombinable.search(pttrn)]
+    alone = [pttrn for pttrn in regexes if pttrn not in combined]
+    combined_re = None
+    if combined:
+        try:
+            combined_re = _compile(
+                "|".join(
+                    "(?P<_p{}>{})".format(idx, pttrn)
+                    for idx, pttrn in enumerate(combined)
+                )
+            )
+        except re.error:
+            logger.info("Patterns could not be combined - checking each.")
+            alone = regexes
+            combined = []
+
+    def hits(line):
+        found = set()
+        if lit_re is not None and lit_re.search(line):
+            found |= automaton.search(line)
+        if combined_re is not None:
+            match = combined_re.search(line)
+            if match:
+                first = combined[int(match.lastgroup[2:])]
+                found.add(first)
+                found.update(
+                    pttrn
+                    for pttrn in combined
+                    if pttrn != first and checks[pttrn](line)
+                )
+        found.update(pttrn for pttrn in alone if checks[pttrn](line))
+        return tuple(sorted(found, key=order.get))
+
+    return hits
+
+
+def iter_multi_matches(file_in, pttrns):
+    """
+    Searches a txt file for many patterns at once, reading it only one
+    time however many patterns there are.
+
+    Required inputs:
+    : file_in - a txt file to have the patterns matched to lines
+    : pttrns - a file name (one pattern per line) or an iterable of them
+
+    Yields (line number, line, tuple of patterns hit) for every line
+    that matched at least one pattern.
+
+    """
+
+    logger.debug("Starting iter_multi_matches()...")
+    hits = _multi_matcher(_load_patterns(pttrns))
+    line_cnt = 0
+    with open(file_in, "r") as file_obj:
+        for line in file_obj:
+            line = str.rstrip(line)
+            found = hits(line)
+            if found:
+                yield str(line_cnt), line, found
+            line_cnt += 1
+    logger.debug("... Ending iter_multi_matches()")
+
+
+def read_n_match_multi(file_in, pttrns):
+    """
+    Batch version of read_n_match() - one read of file_in for a whole
+    list of patterns.
+
+    Required inputs:
+    : file_in - a txt file to have the patterns matched to lines
+    : pttrns - a file name (one pattern per line) or an iterable of them
+
+    Returns a dictionary of pattern to the list read_n_match() would
+    return for it. A line that hit several patterns is in each list.
+
+    """
+
+    logger.debug("Starting read_n_match_multi()...")
+    pttrns = _load_patterns(pttrns)
+    results = {pttrn: [] for pttrn in pttrns}
+
+    try:
+        for line_cnt, line, found in iter_multi_matches(file_in, pttrns):
+            for pttrn in found:
+                results[pttrn].append((line_cnt, line))
+    except IOError:
+        logger.critical("File does not exist.")
+
+    logger.debug("... Ending read_n_match_multi()")
+    return results
+
+
+def _as_lines(text):
+    """
+    Notebook text is either one string or a list of lines.
+
+    Returns a list of lines (without newlines).
+
+    """
+
+    if isinstance(text, list):
+        text = "".join(text)
+    return text.splitlines()
+
+
+def _output_lines(output):
+    """
+    The readable text of one cell output - printed text, the plain text
+    of results, and error messages. Images and other binary data are
+    skipped, so base64 blobs can never match.
+
+    Returns a list of lines.
+
+    """
+
+    kind = output.get("output_type")
+    if kind == "stream":
+        return _as_lines(output.get("text", ""))
+    if kind == "error":
+        trace = "\n".join(output.get("traceback", []))
+        return _as_lines(_ANSI_RE.sub("", trace))
+
+    lines = []
+    data = output.get("data", {})
+    for mime in _NOTEBOOK_TEXT:
+        if mime in data:
+            lines.extend(_as_lines(data[mime]))
+    return lines
+
+
+def _load_notebook(notebook):
+    """
+    Parses a notebook's cells - once per version of the file, the result
+    is kept (by mtime_ns and size) for the next search.
+
+    Returns a list of (source lines, output lines) tuples, one per cell.
+
+    """
+
+    stat = os.stat(notebook)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _notebook_cells.get(notebook)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    logger.debug("Parsing notebook:  '{}'".format(notebook))
+    with open(notebook, "r", encoding="utf-8") as nb_file:
+        cells = json.load(nb_file).get("cells", [])
+    parsed = []
+    for cell in cells:
+        source = _as_lines(cell.get("source", ""))
+        output = []
+        for out in cell.get("outputs", []):
+            output.extend(_output_lines(out))
+        parsed.append((source, output))
+    _notebook_cells[notebook] = (stamp, parsed)
+    return parsed
+
+
+def _repo_root(start=__file__):
+    """
+    Walks up from start (this file) to the first folder holding one of
+    _REPO_MARKERS - wherever the homework copy of this module lives.
+
+    Returns the folder as a Path. Raises FileNotFoundError if there is
+    none.
+
+    """
+
+    here = Path(start).resolve()
+    for folder in here.parents:
+        if any((folder / marker).is_file() for marker in _REPO_MARKERS):
+            return folder
+    raise FileNotFoundError(
+        "No {} above '{}' - pass paths_or_globs".format(
+            " or ".join(_REPO_MARKERS), here
+        )
+    )
+
+
+def iter_notebook_matches(pttrn, paths_or_globs=None, outputs=False):
+    """
+    Searches Jupyter notebooks cell by cell instead of as JSON text - only
+    what is in the cells is looked at, and matches are reported by cell
+    and line within the cell.
+
+    Required inputs:
+    : pttrn - a string to match against the cell lines
+
+    Optional inputs:
+    : paths_or_globs - notebook(s), directory tree(s) or glob pattern(s)
+                       (default is the course notebooks under docs/ at
+                       the top of the repo - see _repo_root())
+    : outputs - also search the text the cells printed / returned
+
+    Yields (notebook, cell number, line number, line, part) tuples -
+    numbers start at 0 like read_n_match(), part is "source" or "output".
+
+    """
+
+    if paths_or_globs is None:
+        root = _repo_root()
+        paths_or_globs = [root / folder for folder in _NOTEBOOK_DIRS]
+    matches = _matcher(pttrn)
+    parts = ("source", "output") if outputs else ("source",)
+
+    for notebook in _expand_paths(paths_or_globs, ".ipynb"):
+        if ".ipynb_checkpoints" in notebook:
+            continue
+        try:
+            cells = _load_notebook(notebook)
+        except ValueError:
+            logger.error("Not a notebook:  '{}'".format(notebook))
+            continue
+
+        for cell_num, cell in enumerate(cells):
+            for part, lines in zip(parts, cell):
+                for line_cnt, line in enumerate(lines):
+                    line = line.rstrip()
+                    if matches(line):
+                        yield notebook, cell_num, line_cnt, line, part
+
+
+def read_n_match_notebooks(pttrn, paths_or_globs=None, outputs=False):
+    """
+    Same as iter_notebook_matches(), collected in a list.
+
+    Returns a list of (notebook, cell number, line number, line, part)
+    tuples.
+
+    """
+
+    logger.debug("Starting read_n_match_notebooks()...")
+    return list(iter_notebook_matches(pttrn, paths_or_globs, outputs))
+
+
+class LineIndex(object):
+    """
+    A sidecar file (<file_in>.lineidx) holding the byte offset every line
+    of a txt file starts at, stored as unsigned 64 bit ints. It is built
+    once, then memory-mapped, so opening it costs the same for any size
+    of file. A missing or stale (size / mtime changed) sidecar is
+    rebuilt the first time it is needed.
+
+    """
+
+    def __init__(self, file_in, index_path=None):
+        """
+        Opens the line index for file_in, building it first if needed.
+
+        Required inputs:
+        : file_in - the txt file the index is for
+
+        Optional inputs:
+        : index_path - where the sidecar lives (default is next to file_in)
+
+        """
+
+        logger.debug("Opening line index for '{}'".format(file_in))
+        self.file_in = str(file_in)
+        self.index_path = index_path or self.file_in + ".lineidx"
+        self._map = self._starts = None
+
+        stat = os.stat(self.file_in)
+        self.size = stat.st_size
+        if not self._load(stat):
+            logger.info("Line index stale - rebuilding:  " + self.index_path)
+            self.build(stat)
+            self._load(stat)
+
+        # the sidecar leaves out the "line" after a final newline, so
+        # newlines_before() needs to know if there is one
+        with open(self.file_in, "rb") as file_obj:
+            file_obj.seek(max(self.size - 1, 0))
+            self._ends_newline = file_obj.read(1) == b"\n"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._starts)
+
+    def close(self):
+        """
+        Lets go of the memory-mapped sidecar.
+
+        """
+
+        if self._map is not None:
+            self._starts.release()
+            self._map.close()
+            self._map = self._starts = None
+
+    def _load(self, stat):
+        """
+        Maps the sidecar if it is there and matches the file.
+
+        Returns a boolean.
+
+        """
+
+        try:
+            with open(self.index_path, "rb") as idx_obj:
+                header = idx_obj.read(_LINEIDX_HEADER.size)
+                if len(header) < _LINEIDX_HEADER.size:
+                    return False
+                expected = (_LINEIDX_TAG, stat.st_size, stat.st_mtime_ns)
+                if _LINEIDX_HEADER.unpack(header) != expected:
+                    return False
+                fileno = idx_obj.fileno()
+                self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except IOError:
+            return False
+
+        header_size = _LINEIDX_HEADER.size
+        with memoryview(self._map) as view:
+            self._starts = view[header_size:].cast("Q")
+        return True
+
+    def build(self, stat=None):
+        """
+        Scans the file once for newlines and (re)writes the sidecar.
+
+        """
+
+        logger.debug("Starting LineIndex.build()...")
+        stat = stat or os.stat(self.file_in)
+        starts = array("Q", [0] if stat.st_size else [])
+        with open(self.file_in, "rb") as file_obj:
+            pos = 0
+            for block in iter(partial(file_obj.read, _COUNT_BLOCK), b""):
+                found = block.find(b"\n")
+                while found != -1:
+                    starts.append(pos + found + 1)
+                    found = block.find(b"\n", found + 1)
+                pos += len(block)
+        # a newline at the very end does not start another line
+        if starts and starts[-1] == stat.st_size:
+            starts.pop()
+
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "wb") as idx_obj:
+            header = (_LINEIDX_TAG, stat.st_size, stat.st_mtime_ns)
+            idx_obj.write(_LINEIDX_HEADER.pack(*header))
+            starts.tofile(idx_obj)
+        os.replace(temp_path, self.index_path)
+        logger.debug("... Ending LineIndex.build()")
+
+    def line_range(self, num):
+        """
+        O(1) - the byte range of line num (0 based, like read_n_match).
+
+        Returns a (start, end) tuple - end is where the next line starts,
+        so the range includes the line's newline.
+
+        """
+
+        start = self._starts[num]
+        if num + 1 < len(self._starts):
+            return start, self._starts[num + 1]
+        return start, self.size
+
+    def line_for_offset(self, offset):
+        """
+        O(log n) - which line a byte offset falls in.
+
+        Returns the (0 based) line number.
+
+        """
+
+        if not 0 <= offset < self.size:
+            raise ValueError("Offset {} is outside the file".format(offset))
+        return bisect_right(self._starts, offset) - 1
+
+    def newlines_before(self, offset):
+        """
+        O(log n) - how many newlines come before a byte offset (0 to the
+        file size), i.e. the number of the line a line start begins.
+
+        Returns an int.
+
+        """
+
+        count = max(bisect_right(self._starts, offset) - 1, 0)
+        if offset >= self.size and self._ends_newline:
+            count += 1
+        return count
+
+    def next_line_start(self, offset):
+        """
+        O(log n) - the first line start at or after a byte offset.
+
+        Returns the offset (the file size if no line starts there).
+
+        """
+
+        num = bisect_left(self._starts, offset)
+        return self._starts[num] if num < len(self._starts) else self.size
+
+
+def get_lines(file_in, first, last=None, index_path=None):
+    """
+    Reads some lines straight out of a txt file, using its LineIndex to
+    jump to them instead of reading everything before them.
+
+    Required inputs:
+    : file_in - the txt file
+    : first - the first line number wanted (0 based)
+
+    Optional inputs:
+    : last - the last line number wanted (default is just first)
+    : index_path - where the sidecar lives (default is next to file_in)
+
+    Returns a list of (line number, line) tuples, like read_n_match().
+
+    """
+
+    last = first if last is None else last
+    with LineIndex(file_in, index_path) as line_idx:
+        last = min(last, len(line_idx) - 1)
+        if first > last:
+            return []
+        start = line_idx.line_range(first)[0]
+        end = line_idx.line_range(last)[1]
+
+    with open(file_in, "rb") as file_obj:
+        file_obj.seek(start)
+        raw_lines = file_obj.read(end - start).split(b"\n")
+
+    return [
+        (str(num), raw.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip())
+        for num, raw in zip(range(first, last + 1), raw_lines)
+    ]
+
+
+def _last_line_end(file_obj, start, size):
+    """
+    Finds where the last complete line of a file ends, reading back from
+    the end a block at a time (but never before start).
+
+    Returns the byte offset just past the last newline, or start if
+    there is no complete line after start yet.
+
+    """
+
+    end = size
+    while end > start:
+        begin = max(start, end - _TAIL_BLOCK)
+        file_obj.seek(begin)
+        found = file_obj.read(end - begin).rfind(b"\n")
+        if found != -1:
+            return begin + found + 1
+        end = begin
+    return start
+
+
+def _load_follow_state(state_file):
+    """
+    Reads the follow mode state file.
+
+    Returns a dictionary (empty if there is no usable state file yet).
+
+    """
+
+    try:
+        with open(state_file, "r") as state_obj:
+            return json.load(state_obj)
+    except (IOError, ValueError):
+        return {}
+
+
+def _save_follow_state(state, state_file):
+    """
+    Writes the follow mode state file - to a temporary file first, then
+    swapped in, so a crash never leaves half a state file behind.
+
+    """
+
+    temp_file = "{}.tmp".format(state_file)
+    with open(temp_file, "w") as state_obj:
+        json.dump(state, state_obj, indent=1, sort_keys=True)
+    os.replace(temp_file, state_file)
+
+
+def follow_matches(file_in, pttrn, state_file=_FOLLOW_STATE):
+    """
+    Incremental search for files that keep growing (like logs). The byte
+    offset and line count reached by the last run are kept per (file,
+    pattern) in state_file, so each run only reads what was appended.
+
+    If the file was rotated (new inode) or truncated (smaller than the
+    saved offset), the search starts over from the top. A last line with
+    no newline yet is left for the next run.
+
+    Required inputs:
+    : file_in - a txt file to have a pattern matched to lines
+    : pttrn - a string to match against line in file_in
+
+    Optional inputs:
+    : state_file - where to keep the offsets between runs
+
+    Returns a list of the new matches, numbered from the top of the file.
+
+    """
+
+    logger.debug("Starting follow_matches()...")
+    lines_list = []
+    state = _load_follow_state(state_file)
+    key = "{}\n{}".format(os.path.abspath(file_in), pttrn)
+    seen = state.get(key, {"inode": None, "offset": 0, "lines": 0})
+
+    try:
+        stat = os.stat(file_in)
+        if seen["inode"] != stat.st_ino or stat.st_size < seen["offset"]:
+            if seen["inode"] is not None:
+                logger.info("File rotated or truncated - starting over.")
+            seen = {"inode": stat.st_ino, "offset": 0, "lines": 0}
+
+        offset = seen["offset"]
+        with open(file_in, "rb") as file_obj:
+            end = _last_line_end(file_obj, offset, stat.st_size)
+
+        if end > offset:
+            matches, new_lines = _match_range(file_in, pttrn, offset, end)
+            for num, line in matches:
+                lines_list.append((str(int(num) + seen["lines"]), line))
+            seen = {
+                "inode": stat.st_ino,
+                "offset": end,
+                "lines": seen["lines"] + new_lines,
+            }
+
+    except IOError:
+        logger.critical("File does not exist.")
+        return lines_list
+
+    state[key] = seen
+    _save_follow_state(state, state_file)
+
+    logger.debug("... Ending follow_matches()")
+    return lines_list
+
+
+def _map_corpus(file_in):
+    """
+    Memory-maps a whole corpus (read only).
+
+    Returns the mmap, or an empty bytes for an empty file (which mmap
+    cannot map).
+
+    """
+
+    with open(file_in, "rb") as file_obj:
+        if not file_obj.seek(0, 2):
+            return b""
+        # the map keeps its own handle on the file
+        return mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _init_search_worker(corpora):
+    """
+    Runs once in every worker process of a SearchServer - maps each
+    corpus, so queries never open or read a file.
+
+    """
+
+    for name, file_in in corpora.items():
+        _worker_maps[name] = _map_corpus(file_in)
+
+
+def _search_chunk(name, pttrn, start, end):
+    """
+    Searches one piece of a corpus (in a worker process).
+
+    Required inputs:
+    : name - the corpus, as mapped by _init_search_worker()
+    : pttrn - a string to match against the lines
+    : start / end - byte range to search (must start on a line)
+
+    Returns a list of (line number within the range, line) tuples.
+
+    """
+
+    buf = _worker_maps[name]
+    if _buffer_safe(pttrn):
+        found = _scan_buffer(buf, pttrn, start, end)
+        return [(int(num), line) for num, line in found]
+
+    raw = buf[start:end]
+    if raw.endswith(b"\n"):
+        raw = raw[:-1]
+    matches = _matcher(pttrn)
+    found = []
+    for line_cnt, line in enumerate(raw.split(b"\n")):
+        line = line.decode(_MMAP_ENCODING, _DECODE_ERRORS).rstrip()
+        if matches(line):
+            found.append((line_cnt, line))
+    return found
+
+
+class SearchServer(object):
+    """
+    A long running search service. Corpora (name -> txt file) are mapped
+    and split into line-aligned pieces once, when the server starts;
+    after that a query only costs the matching. Matching runs in a pool
+    of worker processes that each have the corpora mapped too, so many
+    queries can be answered at once.
+
+    Clients connect over a Unix socket or localhost TCP and send one JSON
+    query a line: {"corpus": name, "pattern": pttrn} (plus "limit", if
+    wanted). Matches come back as they are found, one JSON object a
+    line - {"line": number, "text": line} - then {"done": true, "count":
+    matches}, or {"error": message}. See search_service() for a client.
+
+    """
+
+    def __init__(self, corpora, workers=None, line_index=False):
+        """
+        Maps the corpora and starts the worker pool.
+
+        Required inputs:
+        : corpora - dictionary of corpus name -> txt file (UTF-8)
+
+        Optional inputs:
+        : workers - number of worker processes (default is one per CPU)
+        : line_index - split the corpora and number their pieces from
+                       each one's LineIndex sidecar (built if missing or
+                       stale) instead of reading every byte
+
+        """
+
+        logger.debug("Starting SearchServer()...")
+        self.corpora = {name: str(path) for name, path in corpora.items()}
+        self._chunks = {}
+        self._server = None
+
+        for name, file_in in self.corpora.items():
+            if line_index:
+                chunks, line_cnt = self._indexed_chunks(file_in)
+            else:
+                chunks, line_cnt = self._counted_chunks(file_in)
+            self._chunks[name] = chunks
+            logger.info("Loaded corpus '{}' ({} lines)".format(name, line_cnt))
+
+        self._workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPoolExecutor(
+            max_workers=self._workers,
+            initializer=_init_search_worker,
+            initargs=(self.corpora,),
+        )
+
+    @staticmethod
+    def _counted_chunks(file_in):
+        """
+        Splits a corpus into pieces, counting the newlines in each.
+
+        Returns a list of (start, end, first line) tuples and the number
+        of lines.
+
+        """
+
+        buf = _map_corpus(file_in)
+        parts = max(1, len(buf) // _SERVER_CHUNK)
+        chunks = []
+        line_cnt = 0
+        for start, end in _line_ranges(file_in, parts):
+            chunks.append((start, end, line_cnt))
+            line_cnt += _count_newlines(buf, start, end)
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+        return chunks, line_cnt
+
+    @staticmethod
+    def _indexed_chunks(file_in):
+        """
+        Same as _counted_chunks(), but looks the line starts and numbers
+        up in the corpus' LineIndex.
+
+        """
+
+        with LineIndex(file_in) as line_idx:
+            parts = max(1, line_idx.size // _SERVER_CHUNK)
+            chunks = [
+                (start, end, line_idx.newlines_before(start))
+                for start, end in _line_ranges(file_in, parts, line_idx)
+            ]
+            return chunks, line_idx.newlines_before(line_idx.size)
+
+    async def start(self, path=None, host="127.0.0.1", port=0):
+        """
+        Starts listening - on the Unix socket path if given, otherwise on
+        host / port (port 0 picks a free one, see address).
+
+        """
+
+        if path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path)
+        else:
+            self._server = await asyncio.start_server(self._handle, host, port)
+        logger.info("Search service listening on {}".format(self.address))
+
+    @property
+    def address(self):
+        """
+        Where the server is listening (socket path or (host, port)).
+
+        """
+
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        """
+        Answers queries until cancelled.
+
+        """
+
+        await self._server.serve_forever()
+
+    def close(self):
+        """
+        Stops listening and shuts down the worker pool.
+
+        """
+
+        if self._server is not None:
+            self._server.close()
+        self._pool.shutdown(cancel_futures=True)
+
+    async def _handle(self, reader, writer):
+        """
+        Answers the queries on one connection, one after the other.
+
+        """
+
+        try:
+            async for raw in reader:
+                try:
+                    query = json.loads(raw)
+                    await self._answer(query, writer)
+                except Exception as err:
+                    logger.error("Query failed:  {}".format(err))
+                    _send(writer, {"error": str(err)})
+                await writer.drain()
+        except ConnectionError:
+            logger.info("Client went away.")
+        finally:
+            writer.close()
+
+    async def _answer(self, query, writer):
+        """
+        Runs one query - about one piece of the corpus per worker is in
+        the pool at a time, and as each is done (in order) its matches
+        are sent and the next piece is handed over. A query that stops
+        early (limit) leaves the rest unsearched, and a big corpus does
+        not crowd other queries out of the pool.
+
+        """
+
+        name = query["corpus"]
+        if name not in self._chunks:
+            raise ValueError("Unknown corpus:  {}".format(name))
+        pttrn = query["pattern"]
+        _compile(pttrn)  # a bad pattern fails here, not in every worker
+        limit = query.get("limit")
+
+        loop = asyncio.get_running_loop()
+        search = partial(_search_chunk, name, pttrn)
+
+        def submit(chunks):
+            for start, end, first_line in chunks:
+                future = loop.run_in_executor(self._pool, search, start, end)
+                pending.append((future, first_line))
+
+        todo = iter(self._chunks[name])
+        pending = deque()
+        line_cnt = 0
+        try:
+            submit(islice(todo, self._workers))
+            while pending:
+                future, first_line = pending.popleft()
+                found = await future
+                submit(islice(todo, 1))
+                for num, line in found:
+                    if limit is not None and line_cnt >= limit:
+                        break
+                    _send(writer, {"line": first_line + num, "text": line})
+                    line_cnt += 1
+                await writer.drain()
+                if limit is not None and line_cnt >= limit:
+                    break
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+        _send(writer, {"done": True, "count": line_cnt})
+
+
+def _send(writer, message):
+    """
+    Queues one JSON line to go back to a search service client.
+
+    """
+
+    writer.write(json.dumps(message).encode("utf-8") + b"\n")
+
+
+def serve(corpora, path=None, host="127.0.0.1", port=0, workers=None):
+    """
+    Runs a SearchServer until it is interrupted (Ctrl+C).
+
+    Required inputs:
+    : corpora - dictionary of corpus name -> txt file
+
+    Optional inputs:
+    : path / host / port - where to listen, see SearchServer.start()
+    : workers - number of worker processes
 
-# =============================================================================
-# This section will set up logging. More information on logging found here:
-#   www.blog.pythonlibrary.org/2012/08/02/python-101-an-intro-to-logging
-#   www.digitalocean.com/community/tutorials/how-to-use-logging-in-python3
-#   www.loggly.com/ultimate-guide/python-logging-basics
-# =============================================================================
-#   NOTES:
-#       - some of the logging is not consistent throughout ... this is
-#           intentional so you can see other ways of leaving breadcrumbs
-#           for your future self
-#       - as mentioned before, there is no one right way to code, so several
-#           different styles have been shared here
-#       - logging levels:
-#           https://docs.python.org/3/library/logging.html#logging-levels
-# =============================================================================
-logging.basicConfig(
-    # consider using formatting instead
-    filename="PHPBBCW3-{}.log".format(
-        today
-    ),  # consider using formatting instead  # noqa: E501
-    filemode="a+",  # overwrites the file every time
-    level=logging.DEBUG,  # lowest logging level
-    format="%(asctime)s|%(levelname)s: %(name)s @ %(lineno)d|%(message)s",
-)
+    """
 
-# setup logging buffer for console
-console = logging.StreamHandler()
-# console.setLevel(logging.DEBUG)  # all DEBUG or higher will show on console
-console.setLevel(logging.WARNING)  # all DEBUG or higher will show on console
+    async def main():
+        server = SearchServer(corpora, workers)
+        try:
+            await server.start(path, host, port)
+            print("Search service listening on {}".format(server.address))
+            await server.serve_forever()
+        finally:
+            server.close()
 
-# set format easy for console to use
-formatter = logging.Formatter("%(asctime)s : %(levelname)s : %(message)s")
-console.setFormatter(formatter)
-logging.getLogger(__name__).addHandler(console)
-logger = logging.getLogger(__name__)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Search service stopped.")
 
 
-def read_n_match(file_in, pttrn):
+def search_service(
+    pttrn,
+    corpus,
+    path=None,
+    host="127.0.0.1",
+    port=None,
+    limit=None,
+):
     """
-    Reads in a txt file. Will attempt to match an input pattern,
-    and if found add to a list.
+    Sends one query to a SearchServer and hands back the matches as they
+    arrive.
 
     Required inputs:
-    : file_in - a txt file to have a pattern matched to lines
-    : pattern - a string to match against line in file_in
+    : pttrn - a string to match against the corpus lines
+    : corpus - the corpus name
+
+    Optional inputs:
+    : path - the server's Unix socket, or host / port for TCP
+    : limit - stop after this many matches
 
-    Returns a list.
+    Yields (line number, line) tuples, like iter_matches(). Raises a
+    ValueError if the server could not run the query.
 
     """
 
-    logger.debug("Starting read_n_match()...")
-    lines_list = []
+    if path is not None:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(path)
+    else:
+        conn = socket.create_connection((host, port))
+
+    query = {"corpus": corpus, "pattern": pttrn, "limit": limit}
+    with conn, conn.makefile("rb") as replies:
+        conn.sendall(json.dumps(query).encode("utf-8") + b"\n")
+        for raw in replies:
+            reply = json.loads(raw)
+            if "error" in reply:
+                raise ValueError(reply["error"])
+            if reply.get("done"):
+                return
+            yield str(reply["line"]), reply["text"]
+
+
+def _output_name(file_name, ext=".txt"):
+    """
+    Makes sure the output file name ends in .txt (or ext)
+
+    Returns the file name.
+
+    """
+
+    if not file_name.endswith(ext):
+        logger.warning("File is not a {} file!".format(ext[1:].upper()))
+        logger.debug(
+            "Adding appropriate extension - did not check for others."
+        )  # noqa: E501
+        file_name = file_name + ext
+    return file_name
+
+
+def _divider(file_name):
+    """
+    Works out if a divider is needed between this run and the last one.
+
+    Returns the divider string (empty for a new file).
+
+    """
+
+    path = Path(file_name)
+    logger.debug("Checking to see if new file or appending...")
+    if path.is_file():
+        logger.info("File was already created! Adding divider.")
+        divider = _RUN_DIVIDER
+    else:
+        logger.info("File was not yet created. No divider needed.")
+        divider = ""
+    return divider
+
+
+def _count_line(count):
+    """
+    The "found in X lines" header line, padded out to the same length
+    for any count so it can be written over once the count is known.
+
+    """
+
+    padding = " " * (_COUNT_WIDTH - len(str(count)))
+    return "The pattern was found in {} lines.{}\n\n".format(count, padding)
+
+
+def _has_context(items):
+    """
+    Checks if a list of matches came with context lines - read_n_match()
+    then hands back (line number, line, is match) for every item.
+
+    Returns a boolean.
+
+    """
+
+    return len(items) > 0 and len(items[0]) > 2
+
+
+def _txt_lines(items):
+    """
+    The text layout for matches that may have context lines: these get
+    a "-" after the line number, and "--" goes between windows that do
+    not touch, like grep does.
+
+    Yields (record, is match) tuples.
+
+    """
+
+    last = None
+    for item in items:
+        is_match = item[2:3] != (False,)
+        if len(item) > 2:
+            num = int(item[0])
+            if last is not None and num > last + 1:
+                yield "--\n", False
+            last = num
+
+        mark = "" if is_match else "-"
+        yield item[0] + mark + "\t" + item[1] + "\n", is_match
+
+
+def _txt_records(items, pttrn):
+    """
+    The text layout: "line number<TAB>line" per match (see _txt_lines()
+    for context lines).
+
+    Returns (list of records, number of matches).
+
+    """
+
+    if not _has_context(items):
+        # file_object.write('string')
+        body = [num + "\t" + line + "\n" for num, line in items]
+        return body, len(body)
+
+    body = []
     line_cnt = 0
+    for record, is_match in _txt_lines(items):
+        body.append(record)
+        line_cnt += is_match
+    return body, line_cnt
 
-    try:
-        logger.debug("Attempting to read in TXT file:  '{}'".format(file_in))
-        with open(file_in, "r") as file_in:
-            for line in file_in:
-                # str.rstrip([chars])
-                line = str.rstrip(line)
 
-                # if pattern in line:
-                if re.search(pttrn, line):
-                    lines_list.append((str(line_cnt), line))
+def _jsonl_records(items, pttrn):
+    """
+    JSON Lines: one {"pattern", "line", "text", "match"} object a line.
+    The record is filled in by hand - json.dumps() on a dictionary per
+    match is several times slower, and only the strings need escaping.
 
-                line_cnt += 1
+    Returns (list of records, number of matches).
 
-    except IOError:
-        logger.critical("File does not exist.")
+    """
 
-    logger.debug("... Ending read_n_match()")
-    return lines_list
+    quote = json.encoder.encode_basestring_ascii
+    head = '{"pattern": ' + quote(pttrn) + ', "line": '
+    text = ', "text": '
+    tails = {True: ', "match": true}\n', False: ', "match": false}\n'}
+
+    if not _has_context(items):
+        tail = tails[True]
+        body = [head + num + text + quote(line) + tail for num, line in items]
+        return body, len(body)
+
+    body = [
+        head + num + text + quote(line) + tails[is_match]
+        for num, line, is_match in items
+    ]
+    return body, sum(item[2] for item in items)
+
+
+def _csv_records(items, pttrn):
+    """
+    CSV rows of pattern, line, text, match (1 or 0).
+
+    Returns (list of rows, number of matches).
+
+    """
+
+    if not _has_context(items):
+        body = [[pttrn, num, line, 1] for num, line in items]
+        return body, len(body)
+
+    body = [[pttrn, num, line, int(is_match)] for num, line, is_match in items]
+    return body, sum(row[3] for row in body)
+
+
+def _bin_records(items, pttrn):
+    """
+    Binary records: a _BIN_LINE struct (line number, text length, is
+    match) followed by the UTF-8 text.
+
+    Returns (list of records, number of matches).
+
+    """
+
+    context = _has_context(items)
+    pack = _BIN_LINE.pack
+    body = []
+    line_cnt = 0
+    for item in items:
+        is_match = item[2] if context else True
+        text = item[1].encode("utf-8")
+        body.append(pack(int(item[0]), len(text), is_match) + text)
+        line_cnt += is_match
+    return body, line_cnt
+
+
+def _write_matches(output_file, items):
+    """
+    Writes matches in the text layout (see _txt_lines()).
+
+    Returns the number of matching lines written.
+
+    """
+
+    line_cnt = 0
+    for record, is_match in _txt_lines(items):
+        output_file.write(record)
+        line_cnt += is_match
+    return line_cnt
+
+
+def read_bin_results(file_name):
+    """
+    Reads back a file written by print_to_file(..., fmt="bin").
+
+    Required inputs:
+    : file_name - the .bin file
+
+    Returns a list of (pattern, list of matches) tuples, one per run -
+    matches are (line number, line) tuples, or (line number, line, is
+    match) tuples for runs with context lines.
+
+    """
+
+    runs = []
+    with open(file_name, "rb") as bin_file:
+        data = bin_file.read()
+
+    pos = 0
+    while pos < len(data):
+        tag, pttrn_len, rec_cnt, context = _BIN_RUN.unpack_from(data, pos)
+        if tag != _BIN_TAG:
+            raise ValueError("Not a results file:  {}".format(file_name))
+        pos += _BIN_RUN.size
+        end = pos + pttrn_len
+        pttrn = data[pos:end].decode("utf-8")
+        pos = end
+
+        items = []
+        for _ in range(rec_cnt):
+            num, text_len, is_match = _BIN_LINE.unpack_from(data, pos)
+            pos += _BIN_LINE.size
+            end = pos + text_len
+            text = data[pos:end].decode("utf-8")
+            pos = end
+            item = (str(num), text, is_match) if context else (str(num), text)
+            items.append(item)
+        runs.append((pttrn, items))
+
+    return runs
 
 
-def print_to_file(line_list, pttrn, file_name="output.txt"):
+def print_to_file(line_list, pttrn, file_name=None, fmt="txt"):
     """
     This function will take a list of lines found from read_and_match()
     function, then print to a text file.
 
+    Everything is formatted in one pass and handed to writelines() on a
+    file with a large buffer. Whether the divider is needed comes from
+    the opened file itself, not another look at the disk.
+
     Required inputs:
     : line_list - list of lines returned from read_and_match() function
+                  (context lines are written too, but not counted)
     : pttrn - text to locate in the file
     : filename_in
 
+    Optional inputs:
+    : file_name - default is output plus the format's extension
+    : fmt - "txt" (default, the layout for people), "jsonl" (JSON Lines),
+            "csv" or "bin" (binary records, see read_bin_results()) -
+            every run is added to the end of the file
+
     """
 
     logger.debug("Starting print_to_file()...")
-    if file_name[-4:] != ".txt":
-        logger.warning("File is not a TXT file!")
-        logger.debug(
-            "Adding appropriate extension - did not check for others."
-        )  # noqa: E501
-        file_name = file_name + ".txt"
+    if fmt not in _OUTPUT_FORMATS:
+        raise ValueError("fmt must be one of " + ", ".join(_OUTPUT_FORMATS))
+    ext, records = _OUTPUT_FORMATS[fmt]
+    file_name = _output_name(file_name or "output" + ext, ext)
 
-    path = Path(file_name)
-    logger.debug("Checking to see if new file or appending...")
-    if path.is_file():
-        logger.info("File was already created! Adding divider.")
-        divider = "\n{}\n\n".format("=" * 69)
-    else:
+    body, line_cnt = records(line_list, pttrn)
+
+    # csv does its own line endings, bin is bytes
+    options = {"buffering": _WRITE_BUFFER}
+    if fmt in ("jsonl", "csv"):
+        options["encoding"] = "utf-8"
+    if fmt == "csv":
+        options["newline"] = ""
+    mode = "ab" if fmt == "bin" else "a"
+    with open(file_name, mode, **options) as output_file:
+        logger.debug("Writing to output file ...")
+        start = output_file.tell()
+        new_file = start == 0
+        if fmt == "txt":
+            _txt_header(output_file, pttrn, line_cnt, new_file)
+            output_file.writelines(body)
+            end = output_file.tell()
+        elif fmt == "jsonl":
+            output_file.writelines(body)
+        elif fmt == "csv":
+            rows = csv.writer(output_file)
+            if new_file:
+                rows.writerow(["pattern", "line", "text", "match"])
+            rows.writerows(body)
+        else:
+            context = _has_context(line_list)
+            raw_pttrn = pttrn.encode("utf-8")
+            header = (_BIN_TAG, len(raw_pttrn), len(body), context)
+            output_file.write(_BIN_RUN.pack(*header) + raw_pttrn)
+            output_file.writelines(body)
+
+    if fmt == "txt":
+        _index_run(file_name, start, end, pttrn, line_cnt)
+
+    print(
+        "File created with {} lines found that match '{}'.".format(
+            line_cnt,
+            pttrn,
+        )
+    )
+    print("Please locate the following in your folder:\n{}".format(file_name))
+    # print(file_name)
+    logger.debug("... Ending print_to_file()")
+
+
+def _txt_header(output_file, pttrn, line_cnt, new_file):
+    """
+    Writes the divider (unless new_file) and the header of a text run.
+
+    """
+
+    if new_file:
         logger.info("File was not yet created. No divider needed.")
         divider = ""
+    else:
+        logger.info("File was already created! Adding divider.")
+        divider = _RUN_DIVIDER
+    output_file.writelines(
+        [
+            divider,
+            # output_file.write('The pattern you requested was ' + pattern + '\nYour count was:\t ' + str(len(line_list)))  # noqa: E501
+            _RUN_HEADER + pttrn + "\n",
+            "The pattern was found in {} lines.\n\n".format(line_cnt),
+            "*****" * 3 + "\n\n",
+        ]
+    )
+
+
+# print_to_file() formats - file extension and record maker
+_OUTPUT_FORMATS = {
+    "txt": (".txt", _txt_records),
+    "jsonl": (".jsonl", _jsonl_records),
+    "csv": (".csv", _csv_records),
+    "bin": (".bin", _bin_records),
+}
 
-    with open(file_name, "a+") as output_file:
+
+def stream_to_file(matches, pttrn, file_name="output.txt"):
+    """
+    Same output as print_to_file(), but takes any iterable of matches
+    (like iter_matches()) and writes each one as it comes in, so the
+    matches never all have to be in memory at once.
+
+    The count is not known until the end, so the header line is written
+    with room to spare and filled in afterwards.
+
+    Required inputs:
+    : matches - iterable of (line number, line) tuples
+    : pttrn - text to locate in the file
+    : filename_in
+
+    Returns the number of matching lines written.
+
+    """
+
+    logger.debug("Starting stream_to_file()...")
+    file_name = _output_name(file_name)
+    divider = _divider(file_name)
+    line_cnt = 0
+
+    # append mode sends every write to the end - we need to seek back
+    with open(file_name, "r+" if divider else "w") as output_file:
         logger.debug("Writing to output file ...")
+        start = output_file.seek(0, 2)
         output_file.write(divider)
-        # output_file.write('The pattern you requested was ' + pattern + '\nYour count was:\t ' + str(len(line_list)))  # noqa: E501
-        output_file.write(
-            "The pattern you asked to search for is:\t{}\n".format(pttrn)
-        )  # noqa: E501
-        output_file.write(
-            "The pattern was found in {} lines.\n\n".format(len(line_list))
-        )
+        output_file.write(_RUN_HEADER + pttrn + "\n")
+        count_pos = output_file.tell()
+        output_file.write(_count_line(line_cnt))
 
         output_file.write("*****" * 3 + "\n\n")
 
-        for item in line_list:
-            # file_object.write('string')
-            output_file.write(item[0] + "\t" + item[1] + "\n")
+        line_cnt = _write_matches(output_file, matches)
+        end = output_file.tell()
+
+        output_file.seek(count_pos)
+        output_file.write(_count_line(line_cnt))
+
+    _index_run(file_name, start, end, pttrn, line_cnt)
 
     print(
         "File created with {} lines found that match '{}'.".format(
-            len(line_list), pttrn
+            line_cnt,
+            pttrn,
         )
     )
     print("Please locate the following in your folder:\n{}".format(file_name))
-    # print(file_name)
-    logger.debug("... Ending print_to_file()")
+    logger.debug("... Ending stream_to_file()")
+    return line_cnt
+
+
+def _runs_path(file_name):
+    """
+    Where the run index of a text output file lives.
+
+    """
+
+    return file_name + _RUNS_EXT
+
+
+def _load_runs(file_name, size=None):
+    """
+    Reads the run index, if there is one and it still covers the whole
+    output file (something else may have written to it since).
+
+    Optional inputs:
+    : size - how far the index should go (default is the file's size)
+
+    Returns a list of runs, or None if the index has to be rebuilt.
+
+    """
+
+    try:
+        if size is None:
+            size = os.path.getsize(file_name)
+        with open(_runs_path(file_name), "r") as runs_obj:
+            runs = [json.loads(line) for line in runs_obj]
+    except (IOError, ValueError):
+        return None
+
+    if (runs[-1]["end"] if runs else 0) != size:
+        return None
+    return runs
+
+
+def _save_runs(file_name, runs):
+    """
+    Writes the whole run index - to a temporary file first, then swapped
+    in, like the follow mode state.
+
+    """
+
+    temp_file = _runs_path(file_name) + ".tmp"
+    with open(temp_file, "w") as runs_obj:
+        runs_obj.writelines(json.dumps(run) + "\n" for run in runs)
+    os.replace(temp_file, _runs_path(file_name))
+
+
+def _index_run(file_name, start, end, pttrn, count):
+    """
+    Adds a run just written to a text output file to its run index.
+    The run's block starts after the divider (if any) at byte start and
+    ends at byte end.
+
+    """
+
+    offset = start + len(_RUN_DIVIDER) if start else 0
+    run = {
+        "offset": offset,
+        "end": end,
+        "pattern": pttrn,
+        "count": count,
+        "time": datetime.now().isoformat(timespec="seconds"),
+    }
+
+    runs = _load_runs(file_name, start) if start else []
+    if runs is None:
+        # runs the index does not know about - start over from the file
+        runs = rebuild_run_index(file_name)
+        runs[-1]["time"] = run["time"]
+        _save_runs(file_name, runs)
+        return
+
+    with open(_runs_path(file_name), "a" if start else "w") as runs_obj:
+        runs_obj.write(json.dumps(run) + "\n")
+
+
+def rebuild_run_index(file_name):
+    """
+    Scans a text output file for its runs and writes a new run index.
+    Times are not in the output file, so rebuilt runs have a time of
+    None.
+
+    Required inputs:
+    : file_name - a file written by print_to_file() / stream_to_file()
+
+    Returns the list of runs (see list_runs()).
+
+    """
+
+    logger.debug("Rebuilding run index for '{}'".format(file_name))
+    header = _RUN_HEADER.encode("utf-8")
+    cut = len(header)
+    divider = _RUN_DIVIDER.strip().encode("utf-8")
+    runs = []
+    pos = 0
+    with open(file_name, "rb") as file_obj:
+        for raw in file_obj:
+            if raw.startswith(header):
+                if runs and runs[-1]["end"] is None:
+                    runs[-1]["end"] = pos
+                pttrn = raw[cut:].rstrip(b"\r\n").decode("utf-8")
+                run = {"offset": pos, "end": None, "pattern": pttrn}
+                run.update(count=0, time=None)
+                runs.append(run)
+            elif raw.rstrip() == divider and runs:
+                # the divider's blank line before this one is not the run's
+                runs[-1]["end"] = pos - 1
+            elif runs and not runs[-1]["count"]:
+                found = _RUN_COUNT_RE.match(raw)
+                if found:
+                    runs[-1]["count"] = int(found.group(1))
+            pos += len(raw)
+
+    if runs and runs[-1]["end"] is None:
+        runs[-1]["end"] = pos
+    _save_runs(file_name, runs)
+    return runs
+
+
+def list_runs(file_name):
+    """
+    Lists the runs in a text output file, from its run index (which is
+    rebuilt first if it is missing or out of date).
+
+    Required inputs:
+    : file_name - a file written by print_to_file() / stream_to_file()
+
+    Returns a list of dictionaries with the offset and end (bytes) of the
+    run's block, its pattern, match count and time.
+
+    """
+
+    runs = _load_runs(file_name)
+    if runs is None:
+        logger.info("Run index missing or stale - rebuilding.")
+        runs = rebuild_run_index(file_name)
+    return runs
+
+
+def read_run(file_name, run=-1):
+    """
+    Jumps straight to one run's block in a text output file.
+
+    Required inputs:
+    : file_name - a file written by print_to_file() / stream_to_file()
+
+    Optional inputs:
+    : run - which run (an index into list_runs(), default is the last)
+
+    Returns the run's text - header, count and matching lines.
+
+    """
+
+    found = list_runs(file_name)[run]
+    with open(file_name, "rb") as file_obj:
+        file_obj.seek(found["offset"])
+        raw = file_obj.read(found["end"] - found["offset"])
+    return raw.decode("utf-8", _DECODE_ERRORS)
 
 
 # ===================================================================
@@ -191,11 +3990,32 @@ if __name__ == "__main__":
     print("You are about to read in:\t{}".format(input_file))
     logger.debug("Searching in:\t{}".format(input_file))
 
-    ptrn2find = input("What pattern would you like to look for?\n")
+    ptrn2find = input(
+        "What pattern would you like to look for?\n"
+        "(or @file_name to look for every pattern listed in a file)\n"
+    )
     logger.debug("Searching for:\t{}".format(ptrn2find))
     print()
 
-    list_of_lines = read_n_match(input_file, ptrn2find)
-    print_to_file(list_of_lines, ptrn2find, "PHPBBCW3-{}.txt".format(today))
+    if ptrn2find.startswith("@"):
+        # batch mode - one read of the file for the whole list
+        try:
+            batch = read_n_match_multi(input_file, ptrn2find[1:])
+        except IOError:
+            logger.critical("Pattern file does not exist.")
+            batch = {}
+        output_name = "PHPBBCW3-{}.txt".format(today)
+        for pttrn, list_of_lines in batch.items():
+            print_to_file(list_of_lines, pttrn, output_name)
+    else:
+        # matches go straight from the file search into the output file
+        try:
+            stream_to_file(
+                iter_matches(input_file, ptrn2find),
+                ptrn2find,
+                "PHPBBCW3-{}.txt".format(today),
+            )
+        except IOError:
+            logger.critical("File does not exist.")
 
     logger.debug("Ending {}()...\n".format(__name__))
@@ -1,4 +1,28 @@
-from scripts.W2H2_RPS import get_comp_choice, choices
+import random
+from array import array
+from functools import partial
+
+import pytest
+
+from scripts.W2H2_RPS import (
+    COMP_WINS,
+    OUTCOMES,
+    TIE,
+    USER_WINS,
+    Choice,
+    FixedStrategy,
+    MarkovStrategy,
+    MoveBuffer,
+    Rules,
+    calc_winner,
+    calc_winners,
+    choices,
+    get_comp_choice,
+    rules,
+    seed_comp_choice,
+    simulate,
+    strategies,
+)
 
 
 def test_get_comp_choice_returns_valid_int():
@@ -6,3 +30,180 @@ def test_get_comp_choice_returns_valid_int():
     val = get_comp_choice()
     assert isinstance(val, int)
     assert val in choices.keys()
+
+
+def test_calc_winners_matches_calc_winner():
+    """Every pairing settles in a batch exactly as calc_winner() says."""
+    pairs = [(user, comp) for user in choices for comp in choices] * 3
+    users = array("b", [user for user, _ in pairs])
+    comps = array("b", [comp for _, comp in pairs])
+
+    outcomes = calc_winners(users, comps)
+    assert len(outcomes) == len(pairs)
+    for code, (user, comp) in zip(outcomes, pairs):
+        assert OUTCOMES[code] == calc_winner(user, comp)["winner"]
+    assert len(calc_winners([], [])) == 0
+
+    with pytest.raises(ValueError):
+        calc_winners([1, 2], [1])
+    with pytest.raises(ValueError):
+        calc_winners([1, 0], [1, 1])
+    with pytest.raises(ValueError):
+        calc_winners([1, 4], [1, 1])
+
+
+def test_calc_winners_numpy():
+    """NumPy arrays settle in one lookup and come back as int8 codes."""
+    np = pytest.importorskip("numpy")
+    users = np.array([1, 1, 1, 2, 2, 2, 3, 3, 3], dtype=np.int8)
+    comps = np.array([1, 2, 3, 1, 2, 3, 1, 2, 3], dtype=np.int8)
+
+    outcomes = calc_winners(users, comps)
+    assert isinstance(outcomes, np.ndarray)
+    assert outcomes.dtype == np.int8
+    pairs = zip(users.tolist(), comps.tolist())
+    expected = [calc_winner(user, comp)["winner"] for user, comp in pairs]
+    assert [OUTCOMES[code] for code in outcomes] == expected
+    assert len(calc_winners(np.array([], dtype=np.int8), [])) == 0
+    # other integer widths and plain lists give the same codes
+    unsigned = calc_winners(users.astype(np.uint8), comps.astype(np.uint16))
+    assert unsigned.tolist() == outcomes.tolist()
+    lists = calc_winners(users.tolist(), comps.tolist())
+    assert lists.tolist() == outcomes.tolist()
+
+    with pytest.raises(ValueError):
+        calc_winners(np.array([1, 2]), np.array([1]))
+    with pytest.raises(ValueError):
+        calc_winners(np.array([1, 0]), np.array([1, 1]))
+    with pytest.raises(ValueError):
+        calc_winners(np.array([1, 4]), np.array([1, 1]))
+    with pytest.raises(ValueError):
+        calc_winners(np.array([1, -1]), np.array([1, 1]))
+
+
+def test_rules_engine():
+    """Odd N cycles and explicit graphs settle every pair exactly once."""
+    rpsls = Rules(("rock", "paper", "scissors", "spock", "lizard"))
+    rock, paper, scissors, spock, lizard = range(1, 6)
+    for winner, loser in [
+        (spock, rock),
+        (lizard, spock),
+        (scissors, lizard),
+        (rock, lizard),
+        (paper, spock),
+        (spock, scissors),
+        (paper, rock),
+    ]:
+        assert rpsls.outcome(winner, loser) == USER_WINS
+        assert rpsls.outcome(loser, winner) == COMP_WINS
+    assert rpsls.outcome(spock, spock) == TIE
+
+    big = Rules(str(num) for num in range(101))
+    for move in range(1, 102):
+        wins = [big.outcome(move, other) for other in range(1, 102)]
+        assert wins.count(USER_WINS) == wins.count(COMP_WINS) == 50
+
+    graph = Rules(
+        choices.values(),
+        beats={"rock": ["scissors"], "paper": ["rock"], "scissors": ["paper"]},
+    )
+    assert graph.table == Rules(choices.values()).table
+    with pytest.raises(ValueError):
+        Rules(choices.values(), beats={"rock": ["scissors"]})
+    with pytest.raises(ValueError):
+        Rules(("rock", "paper"))
+
+    player = Choice(rule_set=rpsls)
+    player.choice = lizard
+    assert player.choice == lizard
+    with pytest.raises(ValueError):
+        Choice().choice = lizard
+    assert list(calc_winners([spock], [rock], rpsls)) == [USER_WINS]
+
+
+def test_simulate_is_reproducible():
+    """Same seed and worker count, same counts - whatever the scheduling."""
+    first = simulate(games=3000, workers=2, seed=11)
+    assert first == simulate(games=3000, workers=2, seed=11)
+    assert first != simulate(games=3000, workers=2, seed=12)
+    assert first["wins"] + first["ties"] + first["losses"] == 3000
+    for key in ("wins", "ties", "losses"):
+        low, high = first["intervals"][key]
+        assert low < first["rates"][key] < high
+        assert abs(first["rates"][key] - 1 / 3) < 0.05
+
+    paper = partial(FixedStrategy, move=2)
+    swept = simulate(FixedStrategy, paper, games=10, workers=1)
+    assert swept["losses"] == 10
+    assert swept["intervals"]["losses"][1] == 1.0
+
+
+def test_move_buffer():
+    """Blocks refill transparently and never fold biased bytes into moves."""
+    moves = MoveBuffer(3, block=64, rng=random.Random(5))
+    drawn = [next(moves) for _ in range(1000)]
+    assert set(drawn) == {1, 2, 3}
+    again = MoveBuffer(3, block=64, rng=random.Random(5))
+    assert drawn == [next(again) for _ in range(1000)]
+
+    # 255 is the only byte value 3 does not divide evenly into
+    assert moves._table[:255] == bytes([1, 2, 3] * 85)
+    assert moves._table[255] == 0
+
+    # 129 rejects half of all bytes, so one byte blocks often come back
+    # empty - next() has to keep drawing, not stop
+    tiny = MoveBuffer(129, block=1, rng=random.Random(5))
+    assert all(1 <= next(tiny) <= 129 for _ in range(200))
+
+    for size in (255, 256, 300):
+        wide = MoveBuffer(size, block=8, rng=random.Random(5))
+        assert {next(wide) for _ in range(5000)} == set(range(1, size + 1))
+    assert get_comp_choice() in choices
+
+    # reseeding repeats the moves, blocks already drawn or not
+    seed_comp_choice(7)
+    first = [get_comp_choice() for _ in range(5)]
+    seed_comp_choice(7)
+    assert [get_comp_choice() for _ in range(5)] == first
+
+
+class CycleStrategy(object):
+    """Plays 1, 2, 3, 1, 2, 3, ..."""
+
+    def __init__(self, rule_set, rng):
+        self.move = 0
+
+    def choose(self):
+        self.move = self.move % 3 + 1
+        return self.move
+
+    def observe(self, move):
+        pass
+
+
+def test_markov_strategy_learns_and_stays_bounded():
+    """Patterns are exploited quickly and counters never outgrow the cap."""
+    assert strategies["markov"] is MarkovStrategy
+    for player in (FixedStrategy, CycleStrategy):
+        played = simulate(player, MarkovStrategy, games=300, workers=1)
+        assert played["losses"] >= 290
+
+    markov = MarkovStrategy(rules, random.Random(3), order=1)
+    size = len(markov.counts)
+    for _ in range(3 * MarkovStrategy.cap):
+        markov.observe(2)
+    assert len(markov.counts) == size == 9
+    assert max(markov.counts) <= MarkovStrategy.cap
+    assert markov.choose() == 3
+    assert get_comp_choice(markov) == 3
+
+    # nothing beats rock here, so predicting rock means playing at random
+    unbeaten = Rules(
+        choices.values(),
+        beats={"rock": ["paper", "scissors"], "scissors": ["paper"]},
+    )
+    markov = MarkovStrategy(unbeaten, random.Random(3), order=1)
+    assert markov.counters == [0, 0, 1, 1]
+    for _ in range(10):
+        markov.observe(1)
+    assert {markov.choose() for _ in range(100)} == {1, 2, 3}
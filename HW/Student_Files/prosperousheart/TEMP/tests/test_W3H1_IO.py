@@ -0,0 +1,624 @@
+import asyncio
+import bz2
+import csv
+import gzip
+import json
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import pytest
+
+from scripts import W3H1_IO
+from scripts.W3H1_IO import (
+    LineIndex,
+    MatchSet,
+    ResultCache,
+    SearchServer,
+    follow_matches,
+    get_lines,
+    iter_matches,
+    list_runs,
+    print_to_file,
+    read_bin_results,
+    read_n_match,
+    read_n_match_many,
+    read_n_match_multi,
+    read_n_match_notebooks,
+    read_run,
+    search_service,
+    stream_to_file,
+)
+
+FILES = Path(__file__).parent.parent / "Files"
+ALICE = str(FILES / "Alice In Wonderland Text.txt")
+
+
+def test_read_n_match_mmap_same_as_lines():
+    """mmap mode should find exactly what the line-by-line search finds."""
+    pttrns = ["Alice", "^CHAPTER", "my love", "Queen|King", "zzzz", "."]
+    for pttrn in pttrns:
+        expected = read_n_match(ALICE, pttrn)
+        assert read_n_match(ALICE, pttrn, mmap_mode=True) == expected
+
+    # str only escapes can not go into a bytes regex
+    expected = read_n_match(ALICE, "Alice")
+    escapes = [r"\u0041", r"\U00000041", r"\N{LATIN CAPITAL LETTER A}"]
+    for pttrn in [escape + "lice" for escape in escapes]:
+        assert read_n_match(ALICE, pttrn, mmap_mode=True) == expected
+        assert read_n_match(ALICE, pttrn, bytes_mode=True) == expected
+        assert list(read_n_match(ALICE, pttrn, compact=True)) == expected
+
+
+def test_read_n_match_mmap_line_endings(tmp_path):
+    """CRLF, trailing spaces and a missing final newline are handled."""
+    txt = tmp_path / "crlf.txt"
+    txt.write_bytes("café one  \r\n\r\ntwo one\r\nlast one".encode())
+    assert read_n_match(str(txt), "one", mmap_mode=True) == [
+        ("0", "café one"),
+        ("2", "two one"),
+        ("3", "last one"),
+    ]
+
+    # a lone \r only ends a line in text mode - the byte level searches
+    # split on \n alone (documented in iter_matches())
+    old_mac = tmp_path / "cr.txt"
+    old_mac.write_bytes(b"one\rtwo\rthree\n")
+    assert read_n_match(str(old_mac), "two") == [("1", "two")]
+    joined = [("0", "one\rtwo\rthree")]
+    assert read_n_match(str(old_mac), "two", mmap_mode=True) == joined
+    assert read_n_match(str(old_mac), "two", bytes_mode=True) == joined
+
+
+def test_read_n_match_many_keeps_file_order(tmp_path):
+    """Parallel results come back in the same order as a single worker."""
+    for num in range(6):
+        sub = tmp_path / "dir{}".format(num % 2)
+        sub.mkdir(exist_ok=True)
+        text = "Alice\nno\nAlice {}".format(num)
+        (sub / "f{}.txt".format(num)).write_text(text)
+    (tmp_path / "skip.log").write_text("Alice")
+
+    serial = list(read_n_match_many(tmp_path, "Alice", workers=1))
+    first = str(tmp_path / "dir0" / "f0.txt")
+    matches = [("0", "Alice"), ("2", "Alice 0")]
+    assert len(serial) == 6
+    assert serial[0] == (first, matches)
+    assert list(read_n_match_many(str(tmp_path), "Alice", workers=3)) == serial
+
+    one_glob = str(tmp_path / "*" / "f1.txt")
+    assert list(read_n_match_many(one_glob, "Alice")) == serial[3:4]
+
+
+def test_read_n_match_chunked_line_numbers(monkeypatch):
+    """Chunks are stitched back together with the right line numbers."""
+    monkeypatch.setattr(W3H1_IO, "_MIN_CHUNK", 1)
+    for pttrn in ["Alice", "^CHAPTER", "Turtle.$"]:
+        expected = read_n_match(ALICE, pttrn)
+        assert read_n_match(ALICE, pttrn, workers=4) == expected
+
+
+def test_line_index_splits_and_numbers(tmp_path, monkeypatch):
+    """A line index gives the same ranges and line numbers as counting."""
+    monkeypatch.setattr(W3H1_IO, "_MIN_CHUNK", 1)
+    monkeypatch.setattr(W3H1_IO, "_SERVER_CHUNK", 1 << 14)
+    txt = tmp_path / "alice.txt"
+    no_newline = tmp_path / "no_newline.txt"
+    txt.write_bytes(Path(ALICE).read_bytes())
+    no_newline.write_bytes(b"Alice\n\nsaid Alice\r\nto Alice")
+    for file_in in (str(txt), str(no_newline)):
+        for pttrn in ["Alice", "^CHAPTER", "Turtle.$"]:
+            expected = read_n_match(file_in, pttrn)
+            for options in ({"mmap_mode": True}, {"workers": 4}):
+                options["line_index"] = True
+                assert read_n_match(file_in, pttrn, **options) == expected
+        counted = SearchServer._counted_chunks(file_in)
+        assert SearchServer._indexed_chunks(file_in) == counted
+    assert (tmp_path / "alice.txt.lineidx").is_file()
+
+
+def test_chunked_limit_stops_submitting(monkeypatch):
+    """Hitting the limit leaves the ranges not yet started unsearched."""
+    submitted = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):
+            submitted.append(args[-2:])
+            return super().submit(*args, **kwargs)
+
+    monkeypatch.setattr(W3H1_IO, "_MIN_CHUNK", 1)
+    monkeypatch.setattr(W3H1_IO, "ProcessPoolExecutor", CountingPool)
+    first = read_n_match(ALICE, "Alice", limit=1, workers=2)
+    assert first == read_n_match(ALICE, "Alice", limit=1)
+    assert len(submitted) == 3
+    assert submitted[-1][1] < Path(ALICE).stat().st_size
+
+
+def test_read_n_match_trigram_index(tmp_path):
+    """Indexed search matches a full scan and notices a changed file."""
+    txt = tmp_path / "alice.txt"
+    txt.write_bytes(Path(ALICE).read_bytes())
+    pttrns = ["Mock Turtle", "Hatter|Dormouse", "^CHAPTER [IVX]+", "e"]
+    # escapes longer than two characters are not text the line must hold
+    pttrns += [r"\x41lice", r"\101lice", r"\u0041lice", r"\U00000041lice"]
+    pttrns += [r"\N{LATIN CAPITAL LETTER A}lice", r"(t)\1le", r"\0?Alice"]
+    for pttrn in pttrns:
+        expected = read_n_match(str(txt), pttrn)
+        assert read_n_match(str(txt), pttrn, index=True) == expected
+    assert (tmp_path / "alice.txt.tri").is_file()
+
+    txt.write_text("no turtles here\nMock Turtle soup\n")
+    assert read_n_match(str(txt), "Mock Turtle", index=True) == [
+        ("1", "Mock Turtle soup")
+    ]
+
+
+def test_stream_to_file_same_as_print_to_file(tmp_path):
+    """Streaming writes the same layout, with the count filled in after."""
+    printed = str(tmp_path / "printed.txt")
+    streamed = str(tmp_path / "streamed.txt")
+    for pttrn in ["Mock Turtle", "zzzz"]:
+        print_to_file(read_n_match(ALICE, pttrn), pttrn, printed)
+        count = stream_to_file(iter_matches(ALICE, pttrn), pttrn, streamed)
+        assert count == len(read_n_match(ALICE, pttrn))
+
+    with open(printed) as p_file, open(streamed) as s_file:
+        p_lines = p_file.read().splitlines()
+        s_lines = [line.rstrip() for line in s_file.read().splitlines()]
+    assert s_lines == p_lines
+
+
+def test_literal_fast_path(tmp_path):
+    """Plain text skips the regex engine but finds the same lines."""
+    assert W3H1_IO._is_literal("my love")
+    assert not W3H1_IO._is_literal("my lov.")
+    assert not W3H1_IO._is_literal("my\\slove")
+
+    txt = tmp_path / "love.txt"
+    txt.write_text("Alas, my love\nmy lové\nmy  love\n", encoding="utf-8")
+    for pttrn in ["my love", "my lové", "love "]:
+        expected = [
+            (str(num), line)
+            for num, line in enumerate(txt.read_text("utf-8").splitlines())
+            if re.search(pttrn, line)
+        ]
+        assert read_n_match(str(txt), pttrn) == expected
+        assert read_n_match(str(txt), pttrn, mmap_mode=True) == expected
+
+
+def test_read_n_match_multi_same_as_one_at_a_time(tmp_path):
+    """One pass over the file gives each pattern its own full result."""
+    pttrns = [
+        "Alice",
+        "lice",
+        "Mock Turtle",
+        "^CHAPTER",
+        "Queen|King",
+        r"(\w)\1",
+        "(?i)turtle",
+    ]
+    pttrn_file = tmp_path / "patterns.txt"
+    pttrn_file.write_text("\n".join(pttrns + ["", "Alice"]) + "\n")
+
+    results = read_n_match_multi(ALICE, str(pttrn_file))
+    assert list(results) == pttrns
+    for pttrn in pttrns:
+        assert results[pttrn] == read_n_match(ALICE, pttrn)
+
+
+def test_linear_engine_same_as_re():
+    """The linear time engine finds the same lines as re does."""
+    pttrns = [r"^CHAPTER [IVX]+\.?$", r"\bMock\s+Turtle", "Qu(ee|i)n"]
+    for pttrn in pttrns:
+        expected = read_n_match(ALICE, pttrn)
+        assert read_n_match(ALICE, pttrn, engine="linear") == expected
+
+
+def test_linear_engine_budget(tmp_path):
+    """Backtracking-heavy patterns finish, and budgets stop a search."""
+    txt = tmp_path / "aaa.txt"
+    txt.write_text("a" * 5000 + "b\n" + "a" * 10 + "\n")
+    found = read_n_match(str(txt), "(a+)+$", engine="linear")
+    assert found == [("1", "a" * 10)]
+
+    with pytest.raises(TimeoutError):
+        list(iter_matches(str(txt), "(a+)+$", engine="linear", max_steps=10))
+    assert read_n_match(str(txt), "(a+)+$", engine="linear", timeout=0) == []
+
+    with pytest.raises(ValueError):
+        read_n_match(str(txt), r"(a)\1", engine="linear")
+
+    # nested repeats multiply - refused before any state is built
+    for pttrn in ["(a{1000}){1000}", "((a{1000}){1000}){1000}"]:
+        with pytest.raises(ValueError, match="NFA states"):
+            read_n_match(str(txt), pttrn, engine="linear", timeout=0.01)
+
+
+def test_follow_matches_only_reads_new_lines(tmp_path):
+    """Each run picks up where the last stopped, and resets on rotation."""
+    log = tmp_path / "app.log"
+    state = str(tmp_path / "state.json")
+    log.write_text("ERROR one\nok\n")
+    assert follow_matches(str(log), "ERROR", state) == [("0", "ERROR one")]
+    assert follow_matches(str(log), "ERROR", state) == []
+
+    with open(log, "a") as log_obj:
+        log_obj.write("ERROR two\nERROR half")
+    assert follow_matches(str(log), "ERROR", state) == [("2", "ERROR two")]
+
+    with open(log, "a") as log_obj:
+        log_obj.write(" done\n")
+    found = follow_matches(str(log), "ERROR", state)
+    assert found == [("3", "ERROR half done")]
+
+    log.write_text("ERROR after truncate\n")
+    found = follow_matches(str(log), "ERROR", state)
+    assert found == [("0", "ERROR after truncate")]
+
+
+def test_line_index_sidecar(tmp_path):
+    """Line ranges and offset lookups, rebuilt when the file changes."""
+    txt = tmp_path / "lines.txt"
+    txt.write_bytes(b"zero\r\none\n\ntHree")
+    with LineIndex(str(txt)) as line_idx:
+        assert len(line_idx) == 4
+        assert line_idx.line_range(1) == (6, 10)
+        assert line_idx.line_range(3) == (11, 16)
+        offsets = (0, 5, 6, 15)
+        lines = [line_idx.line_for_offset(pos) for pos in offsets]
+        assert lines == [0, 0, 1, 3]
+    assert (tmp_path / "lines.txt.lineidx").is_file()
+
+    with open(txt, "ab") as txt_obj:
+        txt_obj.write(b"\nfour\n")
+    assert get_lines(str(txt), 3, 10) == [("3", "tHree"), ("4", "four")]
+    alice_idx = str(tmp_path / "alice.lineidx")
+    assert get_lines(ALICE, 0, 5, alice_idx) == read_n_match(ALICE, "")[:6]
+
+
+def test_bytes_mode_only_decodes_hits(tmp_path):
+    """Raw bytes search agrees with the text search, bad bytes included."""
+    txt = tmp_path / "mixed.txt"
+    text = "Alice\xa0\ncafé Alice\nbad ".encode() + b"\xff Alice\n\xfe x\n"
+    txt.write_bytes(text)
+    pttrns = ["Alice", r"\bAlice$", "café", "x", "�", r"\w+ Alice"]
+    for pttrn in pttrns:
+        expected = read_n_match(str(txt), pttrn, encoding="utf-8")
+        assert read_n_match(str(txt), pttrn, bytes_mode=True) == expected
+    found = read_n_match(str(txt), "bad", bytes_mode=True)
+    assert found == [("2", "bad � Alice")]
+
+    latin = tmp_path / "latin.txt"
+    latin.write_bytes("no\ncafé\n".encode("latin-1"))
+    found = read_n_match(str(latin), "é", bytes_mode=True, encoding="latin-1")
+    assert found == [("1", "café")]
+    # the UTF-8 only paths step aside for any other encoding
+    for mode in [{"mmap_mode": True}, {"workers": 2}, {"index": True}]:
+        found = read_n_match(str(latin), "caf", encoding="latin-1", **mode)
+        assert found == [("1", "café")]
+    for pttrn in ["Alice", "^CHAPTER", r"\bMock\b", "Queen|King"]:
+        expected = read_n_match(ALICE, pttrn)
+        assert read_n_match(ALICE, pttrn, bytes_mode=True) == expected
+
+
+@pytest.mark.parametrize("module", ["gzip", "bz2", "lzma"])
+def test_read_n_match_compressed(tmp_path, module):
+    """Compressed files are found by magic number and searched as text."""
+    packed = tmp_path / "alice.archive"
+    packed.write_bytes(__import__(module).compress(Path(ALICE).read_bytes()))
+    for pttrn in ["Mock Turtle", r"^CHAPTER [IVX]+", "e"]:
+        expected = read_n_match(ALICE, pttrn)
+        assert read_n_match(str(packed), pttrn) == expected
+        assert read_n_match(str(packed), pttrn, mmap_mode=True) == expected
+
+    # stopping early shuts the decompressing thread down
+    first = iter_matches(str(packed), "Alice")
+    assert next(first) == read_n_match(ALICE, "Alice")[0]
+    first.close()
+
+
+def test_compressed_magic_is_strict(tmp_path, caplog):
+    """Text that merely starts like bz2 is text; broken archives say so."""
+    txt = tmp_path / "bzh.txt"
+    txt.write_text("BZh hello\nAlice\n")
+    assert read_n_match(str(txt), "Alice") == [("1", "Alice")]
+
+    empty = tmp_path / "empty.bz2"
+    empty.write_bytes(bz2.compress(b""))
+    assert read_n_match(str(empty), "Alice") == []
+
+    broken = tmp_path / "broken.bz2"
+    broken.write_bytes(bz2.compress(b"Alice\n" * 1000)[:-20])
+    with pytest.raises(IOError, match="Could not decompress"):
+        list(iter_matches(str(broken), "Alice"))
+    caplog.clear()
+    read_n_match(str(broken), "Alice")
+    assert "Could not decompress" in caplog.text
+    assert "File does not exist" not in caplog.text
+
+
+def test_context_lines_merge_windows(tmp_path):
+    """Windows that overlap are merged, and written grep style."""
+    txt = tmp_path / "ctx.txt"
+    txt.write_text("a\nb\nHIT\nc\nHIT\nd\ne\nf\ng\nHIT\n")
+    found = read_n_match(str(txt), "HIT", before=2, after=1)
+    nums = " ".join(item[0] for item in found)
+    assert nums == "0 1 2 3 4 5 7 8 9"
+    assert [item[0] for item in found if item[2]] == ["2", "4", "9"]
+    assert read_n_match(str(txt), "HIT", after=1)[-1] == ("9", "HIT", True)
+
+    out = str(tmp_path / "out.txt")
+    print_to_file(found, "HIT", out)
+    with open(out) as out_file:
+        text = out_file.read()
+    assert "found in 3 lines" in text
+    assert text.endswith("4\tHIT\n5-\td\n--\n7-\tf\n8-\tg\n9\tHIT\n")
+
+
+def test_count_limit_and_offset(tmp_path):
+    """Counting keeps no lines, and limit stops reading the file early."""
+    every = read_n_match(ALICE, "Alice")
+    assert read_n_match(ALICE, "Alice", count_only=True) == len(every)
+    options = {"count_only": True, "bitmap": True}
+    count, line_map = read_n_match(ALICE, "Alice", **options)
+    assert count == len(every)
+    bits = range(len(line_map) * 8)
+    marked = [num for num in bits if line_map[num >> 3] >> (num & 7) & 1]
+    assert marked == [int(num) for num, _ in every]
+
+    assert read_n_match(ALICE, "Alice", limit=10) == every[:10]
+    assert read_n_match(ALICE, "Alice", limit=10, offset=5) == every[5:15]
+    assert read_n_match(ALICE, "Alice", offset=len(every)) == []
+
+    # a bad byte far down the file is never read when limit is reached
+    txt = tmp_path / "bad.txt"
+    txt.write_bytes(b"hit\n" + b"filler line\n" * 20000 + b"\xff hit\n")
+    strict = {"encoding": "utf-8", "errors": "strict"}
+    assert read_n_match(str(txt), "hit", limit=1, **strict) == [("0", "hit")]
+    with pytest.raises(UnicodeDecodeError):
+        read_n_match(str(txt), "hit", count_only=True, **strict)
+
+
+def test_compact_match_set(tmp_path):
+    """A MatchSet reads the same lines back, and print_to_file takes it."""
+    for pttrn in ["Alice", r"\w+ Turtle", "Turtle.$"]:
+        expected = read_n_match(ALICE, pttrn)
+        with read_n_match(ALICE, pttrn, compact=True) as found:
+            assert isinstance(found, MatchSet)
+            assert len(found) == len(expected)
+            assert list(found) == expected
+            assert found[-1] == expected[-1]
+            assert found[1:3] == expected[1:3]
+
+    txt = tmp_path / "crlf.txt"
+    txt.write_bytes("café one  \r\n\r\ntwo one\r\nlast one".encode())
+    found = read_n_match(str(txt), "one", compact=True, limit=2)
+    assert list(found) == [("0", "café one"), ("2", "two one")]
+    assert found.lengths.itemsize == 8
+
+    printed = str(tmp_path / "printed.txt")
+    print_to_file(found, "one", printed)
+    with open(printed) as out_file:
+        assert out_file.read().endswith("0\tcafé one\n2\ttwo one\n")
+
+    found.close()
+    txt.write_text("changed")
+    with pytest.raises(ValueError):
+        found[0]
+
+
+def test_compact_compressed_falls_back(tmp_path):
+    """A compressed file has no offsets to keep - it comes back as a list."""
+    packed = tmp_path / "alice.gz"
+    packed.write_bytes(gzip.compress(Path(ALICE).read_bytes()))
+    expected = read_n_match(ALICE, "Alice")
+    found = read_n_match(str(packed), "Alice", compact=True)
+    assert found == expected and len(found) > 0
+    found = read_n_match(str(packed), "Alice", compact=True, limit=2)
+    assert found == expected[:2]
+
+
+def test_result_cache(tmp_path):
+    """Repeat searches come from the cache, changes and size are handled."""
+    txt = tmp_path / "alice.txt"
+    txt.write_bytes(Path(ALICE).read_bytes())
+    cache_path = str(tmp_path / "cache.sqlite")
+    with ResultCache(cache_path) as cache:
+        expected = read_n_match(str(txt), "Alice")
+        assert read_n_match(str(txt), "Alice", cache=cache) == expected
+        assert read_n_match(str(txt), "Alice", cache=cache) == expected
+        count = read_n_match(str(txt), "Alice", count_only=True, cache=cache)
+        assert count == len(expected)
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+        assert stats["bytes"] > 0
+        # a memory-mapped search is not served the plain search's results
+        read_n_match(str(txt), "Alice", mmap_mode=True, cache=cache)
+        assert cache.stats()["misses"] == 3
+        # nor is bytes_mode - and a Path option is fine in the key
+        read_n_match(str(txt), "Alice", bytes_mode=True, cache=cache)
+        assert cache.stats()["misses"] == 4
+        tri = tmp_path / "alice.tri"
+        found = read_n_match(str(txt), "Alice", index=tri, cache=cache)
+        assert found == expected
+        assert cache.stats()["misses"] == 5
+        stats = cache.stats()
+
+        # a changed file is a new key
+        txt.write_text("Alice again\n")
+        found = read_n_match(str(txt), "Alice", cache=cache_path)
+        assert found == [("0", "Alice again")]
+        assert cache.stats()["misses"] == 6
+
+        # a search that fails part way is not kept
+        broken = tmp_path / "broken.txt.gz"
+        broken.write_bytes(gzip.compress(b"Alice\n" * 1000)[:-20])
+        entries = cache.stats()["entries"]
+        assert read_n_match(str(broken), "Alice", cache=cache) == []
+        assert cache.stats()["entries"] == entries
+
+    # only the most recently used results fit
+    with ResultCache(cache_path, max_bytes=stats["bytes"]) as cache:
+        assert cache.stats()["bytes"] <= stats["bytes"]
+        read_n_match(ALICE, "Mock Turtle", cache=cache)
+        read_n_match(ALICE, "Mock Turtle", cache=cache)
+        assert cache.stats()["hits"] == 2
+        assert cache.stats()["bytes"] <= stats["bytes"]
+
+
+def test_print_to_file_formats(tmp_path):
+    """JSON Lines, CSV and binary output hold the same matches."""
+    found = read_n_match(ALICE, "Mock Turtle")
+    ctx = read_n_match(ALICE, "Mock Turtle", after=1, limit=3)
+    base = str(tmp_path / "out")
+    for fmt in ["jsonl", "csv", "bin"]:
+        print_to_file(found, "Mock Turtle", base, fmt=fmt)
+        print_to_file(ctx, 'Turtle,\t"x"', base, fmt=fmt)
+
+    with open(base + ".jsonl", encoding="utf-8") as json_file:
+        records = [json.loads(line) for line in json_file]
+    assert len(records) == len(found) + len(ctx)
+    assert records[0] == {
+        "pattern": "Mock Turtle",
+        "line": int(found[0][0]),
+        "text": found[0][1],
+        "match": True,
+    }
+
+    with open(base + ".csv", newline="", encoding="utf-8") as csv_file:
+        rows = list(csv.reader(csv_file))
+    assert rows[0] == ["pattern", "line", "text", "match"]
+    expected = [["Mock Turtle", num, line, "1"] for num, line in found]
+    for num, line, is_match in ctx:
+        expected.append(['Turtle,\t"x"', num, line, str(int(is_match))])
+    assert rows[1:] == expected
+
+    runs = read_bin_results(base + ".bin")
+    assert runs == [("Mock Turtle", found), ('Turtle,\t"x"', ctx)]
+
+    with pytest.raises(ValueError):
+        print_to_file(found, "Mock Turtle", base, fmt="xml")
+
+
+def test_run_index(tmp_path):
+    """Runs are indexed as they are written, and rebuilt when missing."""
+    out = str(tmp_path / "PHPBBCW3-20240101.txt")
+    turtle = read_n_match(ALICE, "Mock Turtle")
+    print_to_file(turtle, "Mock Turtle", out)
+    stream_to_file(iter_matches(ALICE, "zzzz"), "zzzz", out)
+    print_to_file([("1", "x")], "x", out)
+
+    runs = list_runs(out)
+    assert [run["pattern"] for run in runs] == ["Mock Turtle", "zzzz", "x"]
+    assert [run["count"] for run in runs] == [len(turtle), 0, 1]
+    assert all(run["time"] for run in runs)
+    block = read_run(out, 0)
+    assert block.startswith("The pattern you asked to search for is:\tMock")
+    assert block.endswith("\t" + turtle[-1][1] + "\n")
+
+    with open(out) as out_file:
+        text = out_file.read()
+    blocks = text.split("\n" + "=" * 69 + "\n\n")
+    assert blocks == [read_run(out, num) for num in range(3)]
+
+    Path(out + ".runs").unlink()
+    rebuilt = list_runs(out)
+    assert [run["time"] for run in rebuilt] == [None] * 3
+    for old, new in zip(runs, rebuilt):
+        old["time"] = None
+        assert old == new
+
+    # a run written while the index is missing brings it back
+    Path(out + ".runs").unlink()
+    print_to_file([("2", "y")], "y", out)
+    assert [run["pattern"] for run in list_runs(out)][-2:] == ["x", "y"]
+    assert read_run(out).endswith("2\ty\n")
+
+
+def test_search_server(tmp_path, monkeypatch):
+    """Queries run at the same time and match a plain read_n_match()."""
+    sock = str(tmp_path / "w3h1.sock")
+    corpora = {"alice": ALICE, "empty": tmp_path / "empty.txt"}
+    (tmp_path / "empty.txt").write_text("")
+    pttrns = ["Alice", "^CHAPTER", r"\w+ Turtle$", "Queen|King"]
+    submitted = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):
+            submitted.append(args[-2:])
+            return super().submit(*args, **kwargs)
+
+    async def run():
+        server = SearchServer(corpora, workers=2)
+        await server.start(path=sock)
+        loop = asyncio.get_running_loop()
+
+        def ask(pttrn, corpus="alice", **options):
+            return list(search_service(pttrn, corpus, path=sock, **options))
+
+        try:
+            found = await asyncio.gather(
+                *(loop.run_in_executor(None, ask, pttrn) for pttrn in pttrns)
+            )
+            ask_3 = partial(ask, "e", limit=3)
+            submitted.clear()
+            first = await loop.run_in_executor(None, ask_3)
+            # one piece per worker, plus the next once the first is done
+            assert len(submitted) == 3
+            empty = await loop.run_in_executor(None, ask, "e", "empty")
+            with pytest.raises(ValueError):
+                await loop.run_in_executor(None, ask, "e", "missing")
+        finally:
+            server.close()
+        return found, first, empty
+
+    # several pieces per corpus, so line numbers have to be stitched
+    monkeypatch.setattr(W3H1_IO, "_SERVER_CHUNK", 1 << 14)
+    monkeypatch.setattr(W3H1_IO, "ProcessPoolExecutor", CountingPool)
+    found, first, empty = asyncio.run(run())
+    assert found == [read_n_match(ALICE, pttrn) for pttrn in pttrns]
+    assert first == read_n_match(ALICE, "e", limit=3)
+    assert empty == []
+
+
+def test_notebook_search(tmp_path):
+    """Only cell text is searched, and parsed cells are reused."""
+    image = {"output_type": "display_data", "data": {"image/png": "Alice"}}
+    cells = [
+        {"cell_type": "markdown", "source": ["# Alice\n", "no match"]},
+        {
+            "cell_type": "code",
+            "source": "x = 1\nprint('Alice')",
+            "outputs": [
+                {"output_type": "stream", "text": ["Alice\n"]},
+                image,
+            ],
+        },
+    ]
+    notebook = tmp_path / "lesson.ipynb"
+    notebook.write_text(json.dumps({"cells": cells, "nbformat": 4}))
+    (tmp_path / "notes.txt").write_text("Alice")
+
+    found = read_n_match_notebooks("Alice", tmp_path)
+    name = str(notebook)
+    assert found == [
+        (name, 0, 0, "# Alice", "source"),
+        (name, 1, 1, "print('Alice')", "source"),
+    ]
+    with_out = read_n_match_notebooks("Alice", str(notebook), outputs=True)
+    assert with_out == found + [(name, 1, 0, "Alice", "output")]
+
+    assert W3H1_IO._load_notebook(name) is W3H1_IO._load_notebook(name)
+    notebook.write_text(json.dumps({"cells": cells[:1], "nbformat": 4}))
+    assert read_n_match_notebooks("Alice", name) == found[:1]
+
+    course = read_n_match_notebooks("print")
+    assert course and all(item[0].endswith(".ipynb") for item in course)
+
+    # the repo root is found by walking up, wherever the module sits
+    copy = tmp_path / "repo" / "a" / "b" / "W3H1_IO.py"
+    copy.parent.mkdir(parents=True)
+    (tmp_path / "repo" / "mkdocs.yml").write_text("site_name: x\n")
+    assert W3H1_IO._repo_root(copy) == tmp_path / "repo"
+    assert (W3H1_IO._repo_root() / "docs" / "BC_Weeks").is_dir()